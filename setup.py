@@ -22,6 +22,9 @@ setup(
     url="https://github.com/unified-font-object/ufoNormalizer",
     package_dir={"": "src"},
     py_modules=['ufonormalizer'],
+    extras_require={
+        "lxml": ["lxml"],
+    },
     entry_points={
         'console_scripts': [
             "ufonormalizer = ufonormalizer:main",
@@ -2,19 +2,43 @@
 # -*- coding: utf-8 -*-
 
 import binascii
+import hashlib
+import json
 import time
 import os
 import re
 import shutil
-from xml.etree import cElementTree as ET
+import sys
+import threading
+try:
+    from xml.etree import cElementTree as ET
+except ImportError:
+    from xml.etree import ElementTree as ET
+from xml.parsers import expat
 import plistlib
 import textwrap
 import datetime
+import errno
+import fnmatch
 import glob
-from collections import OrderedDict
+import stat as statModule
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from io import open
 import logging
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from lxml import etree as lxmlET
+except ImportError:
+    lxmlET = None
+
 
 """
 - filter out unknown attributes and subelements
@@ -22,7 +46,7 @@ import logging
 - things that need to be improved are marked with "# TO DO"
 """
 
-__version__ = "0.4.3.dev0"
+__version__ = "0.5.0.dev0"
 description = f"""
 UFO Normalizer (version {__version__}):
 
@@ -70,6 +94,63 @@ def main(args=None):
     parser.add_argument("-m", "--no-mod-times",
                         help="Do not write normalization time stamps.",
                         action="store_true")
+    parser.add_argument("--state-dir",
+                        help="Store the modification state in this cache "
+                             "directory instead of in lib.plist and "
+                             "layerinfo.plist. This also applies "
+                             "with --no-mod-times.")
+    parser.add_argument("--change-detection",
+                        choices=CHANGE_DETECTION_MODES,
+                        default=DEFAULT_CHANGE_DETECTION,
+                        help="How files modified since the previous "
+                             "normalization are detected (default is "
+                             f"{DEFAULT_CHANGE_DETECTION}). The hash mode "
+                             "compares file contents, which survives "
+                             "checkouts and copies that change "
+                             "modification times.")
+    parser.add_argument("--glif-engine",
+                        choices=GLIF_ENGINES,
+                        default=DEFAULT_GLIF_ENGINE,
+                        help="Engine used to normalize GLIF files "
+                             f"(default is {DEFAULT_GLIF_ENGINE}). The "
+                             "expat engine streams each file in one pass "
+                             "and produces the same output.")
+    parser.add_argument("--durability",
+                        choices=DURABILITY_POLICIES,
+                        default=DEFAULT_DURABILITY,
+                        help="How written files are flushed to disk "
+                             f"(default is {DEFAULT_DURABILITY}). Files are "
+                             "always replaced atomically. The file policy "
+                             "syncs every file before it is replaced and the "
+                             "layer policy syncs the files and directory of "
+                             "each layer together once it is done.")
+    parser.add_argument("--dry-run-renames",
+                        help="Report the layer directory and glyph file "
+                             "renames that the normalization would make "
+                             "and exit without modifying the UFO.",
+                        action="store_true")
+    parser.add_argument("--hardlink-output",
+                        help="With --output, hard link the files of the "
+                             "input into the output instead of copying "
+                             "them. Files that are normalized are replaced, "
+                             "so the input is never modified.",
+                        action="store_true")
+    parser.add_argument("--io-threads",
+                        type=int,
+                        default=0,
+                        help="Number of threads that read GLIF files ahead "
+                             "and write them behind the normalization "
+                             "(default is 0, which disables them). This "
+                             "helps on slow or network storage.")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes used to normalize GLIF "
+                             "files (default is 1). The value 0 means "
+                             "one process per CPU core. Scripts that call "
+                             "normalizeUFO with workers must guard the call "
+                             "with if __name__ == \"__main__\" where processes "
+                             "are not forked.")
     args = parser.parse_args(args)
 
     if args.test:
@@ -99,13 +180,26 @@ def main(args=None):
 
     writeModTimes = not args.no_mod_times
 
+    if args.jobs < 0:
+        parser.error("jobs must be >= 0.")
+    workers = args.jobs
+
+    if args.dry_run_renames:
+        for fromSubpath, toSubpath in renamePlanReport(inputPath):
+            log.info('Rename "%s" to "%s".', fromSubpath, toSubpath)
+        return
+
     message = 'Normalizing "%s".'
     if not onlyModified:
         message += " Processing all files."
     log.info(message, os.path.basename(inputPath))
     start = time.time()
     normalizeUFO(inputPath, outputPath=outputPath, onlyModified=onlyModified,
-                 floatPrecision=floatPrecision, writeModTimes=writeModTimes)
+                 floatPrecision=floatPrecision, writeModTimes=writeModTimes,
+                 workers=workers, glifEngine=args.glif_engine,
+                 changeDetection=args.change_detection,
+                 stateDirectory=args.state_dir, durability=args.durability,
+                 ioThreads=args.io_threads, hardlinkOutput=args.hardlink_output)
     runtime = time.time() - start
     log.info("Normalization complete (%.4f seconds).", runtime)
 
@@ -115,10 +209,35 @@ def main(args=None):
 # ---------
 
 modTimeLibKey = "org.unifiedfontobject.normalizer.modTimes"
+hashTokenPrefix = "blake2b:"
+
+# The version of the normalization rules for each file kind.
+# Increment a kind's version whenever a change to this module
+# changes the normalized output of that kind of file. Stored
+# records of files with an outdated kind are discarded, which
+# triggers the renormalization of only those files.
+normalizationRuleVersions = dict(
+    glif1=1,
+    glif2=1,
+    metainfo=1,
+    fontinfo=1,
+    groups=1,
+    kerning=1,
+    layercontents=1,
+    contents=1
+)
 imageReferencesLibKey = "org.unifiedfontobject.normalizer.imageReferences"
 
 
 def _loads(data):
+    if XML_BACKEND == "lxml" and not data.startswith(b"bplist00"):
+        try:
+            root = _xmlFromString(data)
+            if root.tag == "plist" and len(root) == 1:
+                return _convertPlistElementToObject(root[0], strict=True)
+        except (ET.ParseError, AttributeError, TypeError, ValueError):
+            # let plistlib handle, or report, anything unusual
+            pass
     return plistlib.loads(data)
 
 
@@ -126,6 +245,48 @@ def _dumps(plist):
     return plistlib.dumps(plist)
 
 
+# XML parsing
+#
+# lxml is used when it is installed. Comments and processing
+# instructions are dropped and entities are not resolved, which
+# leaves the same elements that xml.etree builds. The parsers
+# are not thread safe, so each thread gets its own.
+
+_lxmlParsers = threading.local()
+
+
+def _lxmlParser(textInput):
+    name = "textParser" if textInput else "bytesParser"
+    parser = getattr(_lxmlParsers, name, None)
+    if parser is None:
+        # text has already been decoded, so ignore the declared encoding
+        parser = lxmlET.XMLParser(
+            encoding="utf-8" if textInput else None,
+            remove_comments=True,
+            remove_pis=True,
+            resolve_entities=False,
+            huge_tree=True
+        )
+        setattr(_lxmlParsers, name, parser)
+    return parser
+
+
+def _xmlFromString(text):
+    """
+    Parse XML text or bytes with the XML_BACKEND parser.
+    """
+    if XML_BACKEND == "lxml":
+        textInput = isinstance(text, str)
+        if textInput:
+            text = text.encode("utf-8")
+        try:
+            return lxmlET.fromstring(text, _lxmlParser(textInput))
+        except lxmlET.XMLSyntaxError as error:
+            # match the exception raised by xml.etree
+            raise ET.ParseError(str(error)) from None
+    return ET.fromstring(text)
+
+
 # Python 3.9 deprecated plistlib.Data. The following _*code_base64 functions
 # preserve some behavior related to that API.
 def _decode_base64(s):
@@ -175,10 +336,104 @@ class UFONormalizerError(Exception):
 DEFAULT_FLOAT_PRECISION = 10
 FLOAT_FORMAT = "%%.%df" % DEFAULT_FLOAT_PRECISION
 
+GLIF_ENGINES = ("tree", "expat")
+DEFAULT_GLIF_ENGINE = "tree"
+GLIF_ENGINE = DEFAULT_GLIF_ENGINE
+
+CHANGE_DETECTION_MODES = ("mtime", "hash")
+DEFAULT_CHANGE_DETECTION = "mtime"
+CHANGE_DETECTION = DEFAULT_CHANGE_DETECTION
+
+DURABILITY_POLICIES = ("none", "file", "layer")
+DEFAULT_DURABILITY = "none"
+DURABILITY = DEFAULT_DURABILITY
+
+XML_BACKENDS = ("lxml", "stdlib")
+DEFAULT_XML_BACKEND = "stdlib" if lxmlET is None else "lxml"
+XML_BACKEND = DEFAULT_XML_BACKEND
+
 
 def normalizeUFO(ufoPath, outputPath=None, onlyModified=True,
-                 floatPrecision=DEFAULT_FLOAT_PRECISION, writeModTimes=True):
-    global FLOAT_FORMAT
+                 floatPrecision=DEFAULT_FLOAT_PRECISION, writeModTimes=True,
+                 workers=None, glifEngine=DEFAULT_GLIF_ENGINE, xmlBackend=None,
+                 changeDetection=DEFAULT_CHANGE_DETECTION, stateDirectory=None,
+                 durability=DEFAULT_DURABILITY, ioThreads=0, hardlinkOutput=False):
+    """
+    Normalize the UFO at ufoPath.
+
+    If workers is greater than 1, GLIF files are normalized by
+    a pool of that many processes. The value 0 means one
+    process per CPU core. None or 1 normalizes serially.
+    The pool uses the platform's default start method. Where
+    that is not fork (Windows, macOS and Python 3.14 or newer
+    on Linux), workers import the main module of the calling
+    script, which must then guard its normalizeUFO call with
+    if __name__ == "__main__".
+
+    glifEngine selects the GLIF normalizer, one of GLIF_ENGINES.
+
+    xmlBackend selects the XML parser, one of XML_BACKENDS.
+    If it is None, lxml is used when it is installed.
+
+    changeDetection selects how modified files are detected,
+    one of CHANGE_DETECTION_MODES. "mtime" compares stat
+    signatures (modification time in nanoseconds and size)
+    and "hash" compares digests of the file contents.
+
+    If stateDirectory is given, the modification times and image
+    references are stored in a state file in that directory
+    instead of in lib.plist and layerinfo.plist, regardless of
+    writeModTimes. A UFO that has not changed is then not written.
+    The state also holds stat fingerprints of the UFO and of each
+    layer, which allow skipping an unchanged UFO or layer entirely.
+
+    Files are always replaced atomically. durability selects
+    how they are flushed to disk, one of DURABILITY_POLICIES.
+    "none" leaves it to the operating system, "file" syncs
+    every written file before it replaces the old one and
+    "layer" syncs the written files of each layer together,
+    followed by the layer directory, and the UFO directory
+    once they have been normalized. With "layer", a crash
+    during a layer may leave files of that layer empty on
+    file systems that don't write the data of a file before
+    renaming it, such as XFS.
+
+    If ioThreads is greater than 0, GLIF files that are not
+    sent to the process pool are read ahead and written behind
+    by that many threads, so that file system latency overlaps
+    with the normalization.
+
+    If outputPath is given, the UFO is cloned next to it, the
+    clone is normalized and then replaces outputPath. The old
+    outputPath is renamed aside just before, so it briefly
+    doesn't exist. Files are copied with copy_file_range where
+    it is available. On file systems with reflinks, such as
+    Btrfs and XFS, the copies share the data of the input and
+    only the normalized files are written. Elsewhere, the data
+    of the files that are then normalized is written twice. If
+    hardlinkOutput is True, the files are hard linked instead
+    and only the normalized files are written. The input is never modified
+    either way, because written files are replaced rather
+    than rewritten.
+    """
+    global FLOAT_FORMAT, GLIF_ENGINE, XML_BACKEND, CHANGE_DETECTION, DURABILITY
+    if durability not in DURABILITY_POLICIES:
+        raise UFONormalizerError(f"Unknown durability policy: {durability}")
+    DURABILITY = durability
+    if changeDetection not in CHANGE_DETECTION_MODES:
+        raise UFONormalizerError(f"Unknown change detection mode: {changeDetection}")
+    CHANGE_DETECTION = changeDetection
+    if glifEngine not in GLIF_ENGINES:
+        raise UFONormalizerError(f"Unknown GLIF engine: {glifEngine}")
+    GLIF_ENGINE = glifEngine
+    if xmlBackend is None:
+        xmlBackend = DEFAULT_XML_BACKEND
+    if xmlBackend not in XML_BACKENDS:
+        raise UFONormalizerError(f"Unknown XML backend: {xmlBackend}")
+    if xmlBackend == "lxml" and lxmlET is None:
+        raise UFONormalizerError("The lxml XML backend is not installed.")
+    XML_BACKEND = xmlBackend
+    log.debug("Using the %s XML backend.", XML_BACKEND)
     if floatPrecision is None:
         # use repr() and don't round floats
         FLOAT_FORMAT = None
@@ -186,12 +441,44 @@ def normalizeUFO(ufoPath, outputPath=None, onlyModified=True,
         # round floats to a fixed number of decimal digits
         FLOAT_FORMAT = "%%.%df" % floatPrecision
     # if the output is going to a different location,
-    # duplicate the UFO to the new place and work
-    # on the new file instead of trying to reconstruct
-    # the file one piece at a time.
+    # clone the UFO next to the output and work on
+    # the clone instead of trying to reconstruct the
+    # file one piece at a time. the clone replaces
+    # the output once it has been normalized.
+    memoStatistics = numberMemoStatistics()
     if outputPath is not None and outputPath != ufoPath:
-        duplicateUFO(ufoPath, outputPath)
-        ufoPath = outputPath
+        with _stagedOutput(ufoPath, outputPath, hardlinkOutput) as stagingPath:
+            with _fileSystemSnapshot():
+                _normalizeUFO(stagingPath, onlyModified, writeModTimes, workers, ioThreads,
+                              stateDirectory, stateUFOPath=outputPath)
+        _logNumberMemoStatistics(memoStatistics)
+        return
+    with _fileSystemSnapshot():
+        _normalizeUFO(ufoPath, onlyModified, writeModTimes, workers, ioThreads, stateDirectory)
+    _logNumberMemoStatistics(memoStatistics)
+
+
+def _logNumberMemoStatistics(previous):
+    hits, misses = numberMemoStatistics()
+    hits -= previous[0]
+    misses -= previous[1]
+    if hits + misses:
+        log.debug("Number memo hit rate in this process: %.1f%% (%d of %d).",
+                  100.0 * hits / (hits + misses), hits, hits + misses)
+
+
+def _normalizeUFO(ufoPath, onlyModified, writeModTimes, workers, ioThreads, stateDirectory,
+                  stateUFOPath=None):
+    # load the state file and skip the UFO if
+    # nothing changed since the previous run
+    state = None
+    if stateUFOPath is None:
+        stateUFOPath = ufoPath
+    if stateDirectory is not None:
+        state = readStateFile(stateDirectory, stateUFOPath)
+        if onlyModified and state["fingerprint"] == ufoFingerprint(ufoPath):
+            log.debug('Skipping unchanged "%s".', os.path.basename(ufoPath))
+            return
     # get the UFO format version
     if not subpathExists(ufoPath, "metainfo.plist"):
         raise UFONormalizerError(f"Required metainfo.plist file not in "
@@ -217,42 +504,77 @@ def normalizeUFO(ufoPath, outputPath=None, onlyModified=True,
         fontLib = subpathReadPlist(ufoPath, "lib.plist")
     # get the modification times
     if onlyModified:
-        modTimes = readModTimes(fontLib)
+        modTimes = readModTimes(fontLib if state is None else state["lib"])
     else:
         modTimes = {}
-    # normalize layers
-    if formatVersion < 3:
-        if subpathExists(ufoPath, "glyphs"):
-            normalizeUFO1And2GlyphsDirectory(ufoPath, modTimes)
-    else:
-        availableImages = readImagesDirectory(ufoPath)
-        referencedImages = set()
-        normalizeGlyphsDirectoryNames(ufoPath)
+    layerStates = {}
+    # normalize layers and top level files. with a process
+    # pool, these are independent units that run concurrently.
+    # layer directories are renamed before any layer is
+    # processed and the images are purged once all layers
+    # have reported their references.
+    with _processPool(workers) as pool, _ioPool(ioThreads) as ioPool, \
+            _unitScheduler(pool is not None) as scheduler:
+        layerUnits = []
+        if formatVersion < 3:
+            if subpathExists(ufoPath, "glyphs"):
+                layerUnits.append(scheduler.submit(
+                    normalizeUFO1And2GlyphsDirectory, ufoPath, modTimes, pool=pool,
+                    ioPool=ioPool, onlyModified=onlyModified))
+        else:
+            availableImages = readImagesDirectory(ufoPath)
+            normalizeGlyphsDirectoryNames(ufoPath)
+            if subpathExists(ufoPath, "layercontents.plist"):
+                layerContents = subpathReadPlist(ufoPath, "layercontents.plist")
+                for _layerName, layerDirectory in layerContents:
+                    layerState = None
+                    glyphMappingPath = None
+                    if state is not None:
+                        layerState = dict(state["layers"].get(layerDirectory, {}))
+                        layerStates[layerDirectory] = layerState
+                        glyphMappingPath = glyphMappingFilePath(stateDirectory, stateUFOPath,
+                                                                layerDirectory)
+                    layerUnits.append(scheduler.submit(
+                        normalizeGlyphsDirectory, ufoPath, layerDirectory,
+                        onlyModified=onlyModified, writeModTimes=writeModTimes,
+                        pool=pool, ioPool=ioPool, state=layerState,
+                        glyphMappingPath=glyphMappingPath))
+        # normalize top level files
+        fileUnits = [scheduler.submit(normalizeMetaInfoPlist, ufoPath, modTimes)]
+        if subpathExists(ufoPath, "fontinfo.plist"):
+            fileUnits.append(scheduler.submit(
+                normalizeFontInfoPlist, ufoPath, modTimes, pool=pool))
+        if subpathExists(ufoPath, "groups.plist"):
+            fileUnits.append(scheduler.submit(
+                normalizeGroupsPlist, ufoPath, modTimes, pool=pool))
+        if subpathExists(ufoPath, "kerning.plist"):
+            fileUnits.append(scheduler.submit(
+                normalizeKerningPlist, ufoPath, modTimes, pool=pool))
         if subpathExists(ufoPath, "layercontents.plist"):
-            layerContents = subpathReadPlist(ufoPath, "layercontents.plist")
-            for _layerName, layerDirectory in layerContents:
-                layerReferencedImages = normalizeGlyphsDirectory(
-                    ufoPath, layerDirectory,
-                    onlyModified=onlyModified, writeModTimes=writeModTimes)
+            fileUnits.append(scheduler.submit(
+                normalizeLayerContentsPlist, ufoPath, modTimes))
+        referencedImages = set()
+        for unit in layerUnits:
+            layerReferencedImages = unit.result()
+            if layerReferencedImages is not None:
                 referencedImages |= layerReferencedImages
-        imagesToPurge = availableImages - referencedImages
-        purgeImagesDirectory(ufoPath, imagesToPurge)
-    # normalize top level files
-    normalizeMetaInfoPlist(ufoPath, modTimes)
-    if subpathExists(ufoPath, "fontinfo.plist"):
-        normalizeFontInfoPlist(ufoPath, modTimes)
-    if subpathExists(ufoPath, "groups.plist"):
-        normalizeGroupsPlist(ufoPath, modTimes)
-    if subpathExists(ufoPath, "kerning.plist"):
-        normalizeKerningPlist(ufoPath, modTimes)
-    if subpathExists(ufoPath, "layercontents.plist"):
-        normalizeLayerContentsPlist(ufoPath, modTimes)
+        if formatVersion >= 3:
+            imagesToPurge = availableImages - referencedImages
+            purgeImagesDirectory(ufoPath, imagesToPurge)
+        for unit in fileUnits:
+            unit.result()
     # update the mod time storage, write, normalize
-    if writeModTimes:
+    if state is None and writeModTimes:
         storeModTimes(fontLib, modTimes)
-        subpathWritePlist(fontLib, ufoPath, "lib.plist")
-    if subpathExists(ufoPath, "lib.plist"):
+        _writeNormalizedPlist(fontLib, ufoPath, ("lib.plist",))
+    elif subpathExists(ufoPath, "lib.plist"):
         normalizeLibPlist(ufoPath)
+    if state is not None:
+        storeModTimes(state["lib"], modTimes)
+        state["layers"] = layerStates
+        state["fingerprint"] = ufoFingerprint(ufoPath)
+        writeStateFile(state, stateDirectory, stateUFOPath)
+    subpathSyncDirectory(ufoPath)
 
 
 # ------
@@ -264,6 +586,25 @@ def normalizeGlyphsDirectoryNames(ufoPath):
     Normalize glyphs directory names following
     UFO 3 user name to file name convention.
     """
+    plan = _glyphsDirectoryNamesPlan(ufoPath)
+    if plan is None:
+        return
+    oldLayerMapping, newLayerMapping, renames = plan
+    for fromDirectory, toDirectory in renames:
+        log.debug('Renaming layer directory "%s" to "%s".', fromDirectory, toDirectory)
+        subpathRenameDirectory(ufoPath, fromDirectory, toDirectory)
+    # update layercontents.plist
+    newLayerMapping = list(newLayerMapping.items())
+    subpathWritePlist([list(item) for item in newLayerMapping], ufoPath, "layercontents.plist")
+    return newLayerMapping
+
+
+def _glyphsDirectoryNamesPlan(ufoPath):
+    """
+    Get the old and new layer directory mappings and the
+    renames that normalizeGlyphsDirectoryNames would make.
+    None is returned if there are no layers.
+    """
     # INVALID DATA POSSIBILITY: directory for layer name may not exist
     # INVALID DATA POSSIBILITY: directory may not be stored in layer contents
     oldLayerMapping = OrderedDict()
@@ -272,11 +613,11 @@ def normalizeGlyphsDirectoryNames(ufoPath):
         for layerName, layerDirectory in layerContents:
             oldLayerMapping[layerName] = layerDirectory
     if not oldLayerMapping:
-        return
+        return None
     # INVALID DATA POSSIBILITY: no default layer
     # INVALID DATA POSSIBILITY: public.default used for directory other than "glyphs"
     newLayerMapping = OrderedDict()
-    newLayerDirectories = set()
+    newLayerDirectories = FileNameIndex()
     for layerName, oldLayerDirectory in oldLayerMapping.items():
         if oldLayerDirectory == "glyphs":
             newLayerDirectory = "glyphs"
@@ -286,78 +627,245 @@ def normalizeGlyphsDirectoryNames(ufoPath):
                                                    prefix="glyphs.")
         newLayerDirectories.add(newLayerDirectory.lower())
         newLayerMapping[layerName] = newLayerDirectory
-    # don't do a direct rename because an old directory
-    # may have the same name as a new directory.
-    fromTempMapping = {}
-    for index, (layerName, newLayerDirectory) in enumerate(newLayerMapping.items()):
-        oldLayerDirectory = oldLayerMapping[layerName]
-        if newLayerDirectory == oldLayerDirectory:
-            continue
-        log.debug('Normalizing "%s" layer directory name to "%s".',
-                  layerName, newLayerDirectory)
-        tempDirectory = f"org.unifiedfontobject.normalizer.{index}"
-        subpathRenameDirectory(ufoPath, oldLayerDirectory, tempDirectory)
-        fromTempMapping[tempDirectory] = newLayerDirectory
-    for tempDirectory, newLayerDirectory in fromTempMapping.items():
-        subpathRenameDirectory(ufoPath, tempDirectory, newLayerDirectory)
-    # update layercontents.plist
-    newLayerMapping = list(newLayerMapping.items())
-    subpathWritePlist(newLayerMapping, ufoPath, "layercontents.plist")
-    return newLayerMapping
+    renames = renamePlan(
+        (oldLayerMapping[layerName], newLayerDirectory)
+        for layerName, newLayerDirectory in newLayerMapping.items())
+    return oldLayerMapping, newLayerMapping, renames
 
 
 # ------
 # Glyphs
 # ------
 
-def normalizeUFO1And2GlyphsDirectory(ufoPath, modTimes):
-    glyphMapping = normalizeGlyphNames(ufoPath, "glyphs")
-    for fileName in sorted(glyphMapping.values()):
-        location = subpathJoin("glyphs", fileName)
-        if subpathNeedsRefresh(modTimes, ufoPath, location):
-            log.debug('Normalizing "%s".', os.path.join("glyphs", fileName))
-            normalizeGLIF(ufoPath, "glyphs", fileName)
-            modTimes[location] = subpathGetModTime(ufoPath, "glyphs", fileName)
+def normalizeUFO1And2GlyphsDirectory(ufoPath, modTimes, pool=None, ioPool=None,
+                                     onlyModified=True):
+    glyphMapping = normalizeGlyphNames(ufoPath, "glyphs", modTimes=modTimes,
+                                       modTimeKey=subpathJoin("glyphs", "contents.plist"))
+    fileNames = sorted(glyphMapping.values())
+    if onlyModified:
+        signatures = None
+        if modTimes and CHANGE_DETECTION == "mtime":
+            signatures = {
+                subpathJoin("glyphs", fileName): signature
+                for fileName, signature in subpathScanStatSignatures(ufoPath, "glyphs").items()
+            }
+        fileNames = [
+            fileName for fileName in fileNames
+            if subpathNeedsRefresh(modTimes, ufoPath, subpathJoin("glyphs", fileName),
+                                   signatures=signatures)
+        ]
+    results = normalizeGLIFFiles(ufoPath, "glyphs", fileNames, pool=pool, ioPool=ioPool)
+    for fileName in fileNames:
+        _imageFileName, modTime = results[fileName]
+        modTimes[subpathJoin("glyphs", fileName)] = modTime
+    subpathSyncDirectory(ufoPath, "glyphs")
 
 
 def normalizeGlyphsDirectory(ufoPath, layerDirectory,
-                             onlyModified=True, writeModTimes=True):
+                             onlyModified=True, writeModTimes=True, pool=None,
+                             ioPool=None, state=None, glyphMappingPath=None):
+    """
+    Normalize the GLIF files in a layer directory and
+    return the file names of the referenced images.
+
+    If state is a dict, the modification times and image
+    references are read from and stored in it instead
+    of the layer lib and layerinfo.plist is not updated.
+    The layer is skipped if its fingerprint in the state
+    matches the layer directory.
+
+    If glyphMappingPath is given, the normalized glyph
+    mapping is kept in that file, so that the next run
+    only translates the glyph names that changed since.
+    See normalizeGlyphNames.
+    """
+    if state is not None:
+        if onlyModified and state.get("fingerprint") == layerFingerprint(ufoPath, layerDirectory):
+            log.debug('Skipping unchanged "%s".', layerDirectory)
+            return set((readImageReferences(state) or {}).values())
+        state.pop("fingerprint", None)
     if subpathExists(ufoPath, layerDirectory, "layerinfo.plist"):
         layerInfo = subpathReadPlist(ufoPath, layerDirectory, "layerinfo.plist")
     else:
         layerInfo = {}
     layerLib = layerInfo.get("lib", {})
+    stateLib = layerLib if state is None else state
     imageReferences = {}
     if onlyModified:
-        stored = readImageReferences(layerLib)
+        stored = readImageReferences(stateLib)
         if stored is not None:
             imageReferences = stored
         else:
             # we don't know what has a reference so we must check everything
             onlyModified = False
     if onlyModified:
-        modTimes = readModTimes(layerLib)
+        modTimes = readModTimes(stateLib)
     else:
         modTimes = {}
-    glyphMapping = normalizeGlyphNames(ufoPath, layerDirectory)
-    for fileName in glyphMapping.values():
-        if subpathNeedsRefresh(modTimes, ufoPath, layerDirectory, fileName):
-            imageFileName = normalizeGLIF(ufoPath, layerDirectory, fileName)
-            if imageFileName is not None:
-                imageReferences[fileName] = imageFileName
-            elif fileName in imageReferences:
-                del imageReferences[fileName]
-            modTimes[fileName] = subpathGetModTime(ufoPath, layerDirectory, fileName)
-    if writeModTimes:
-        storeModTimes(layerLib, modTimes)
-    storeImageReferences(layerLib, imageReferences)
-    layerInfo["lib"] = layerLib
-    subpathWritePlist(layerInfo, ufoPath, layerDirectory, "layerinfo.plist")
-    normalizeLayerInfoPlist(ufoPath, layerDirectory)
+    contentsRecord = modTimes.get("contents.plist")
+    previousGlyphMapping = None
+    if glyphMappingPath is not None:
+        previousGlyphMapping = partial(readGlyphMappingFile, glyphMappingPath, contentsRecord)
+    glyphMapping = normalizeGlyphNames(ufoPath, layerDirectory, modTimes=modTimes,
+                                       previousGlyphMapping=previousGlyphMapping)
+    if glyphMappingPath is not None and modTimes.get("contents.plist") != contentsRecord:
+        writeGlyphMappingFile(glyphMappingPath, modTimes.get("contents.plist"), glyphMapping)
+    fileNames = list(glyphMapping.values())
+    if onlyModified:
+        signatures = None
+        if modTimes and CHANGE_DETECTION == "mtime":
+            signatures = subpathScanStatSignatures(ufoPath, layerDirectory)
+        fileNames = [
+            fileName for fileName in fileNames
+            if subpathNeedsRefresh(modTimes, ufoPath, layerDirectory, fileName,
+                                   signatures=signatures)
+        ]
+    results = normalizeGLIFFiles(ufoPath, layerDirectory, fileNames, pool=pool, ioPool=ioPool)
+    for fileName in fileNames:
+        imageFileName, modTime = results[fileName]
+        if imageFileName is not None:
+            imageReferences[fileName] = imageFileName
+        elif fileName in imageReferences:
+            del imageReferences[fileName]
+        modTimes[fileName] = modTime
+    if state is not None:
+        normalizeLayerInfoPlist(ufoPath, layerDirectory)
+        storeModTimes(state, modTimes)
+        storeImageReferences(state, imageReferences)
+        state.pop("glyphMapping", None)
+        state["fingerprint"] = layerFingerprint(ufoPath, layerDirectory)
+    else:
+        if writeModTimes:
+            storeModTimes(layerLib, modTimes)
+        storeImageReferences(layerLib, imageReferences)
+        layerInfo["lib"] = layerLib
+        _writeNormalizedPlist(layerInfo, ufoPath, (layerDirectory, "layerinfo.plist"),
+                              preprocessor=_normalizeLayerInfoColor)
+    subpathSyncDirectory(ufoPath, layerDirectory)
     referencedImages = set(imageReferences.values())
     return referencedImages
 
 
+def normalizeGLIFFiles(ufoPath, layerDirectory, fileNames, pool=None, ioPool=None):
+    """
+    Normalize the GLIF files in a layer directory.
+
+    Returns a dict mapping each file name to a tuple
+    of the referenced image file name (or None) and
+    the file modification time after normalization.
+
+    If a process pool is given, the files are split
+    into chunks and distributed over the pool, largest
+    files first. The results are identical to the
+    serial path.
+
+    Otherwise, if an I/O thread pool is given, the files
+    are read ahead and written behind by the thread pool
+    while this thread normalizes them. All writes have
+    finished when this returns.
+    """
+    if pool is None or len(fileNames) < _minimumPoolBatchSize:
+        if ioPool is not None:
+            return _normalizeGLIFFilesOverlapped(ufoPath, layerDirectory, fileNames, ioPool)
+        results = {}
+        for fileName in _readAheadOrder(ufoPath, layerDirectory, fileNames):
+            results[fileName] = _normalizeGLIFFile(ufoPath, layerDirectory, fileName)
+        return results
+    # schedule the largest files first so that the
+    # last chunks to finish are the quickest ones
+    sizes = {}
+    for fileName in fileNames:
+        sizes[fileName] = subpathGetSize(ufoPath, layerDirectory, fileName)
+    ordered = sorted(fileNames, key=lambda fileName: (-sizes[fileName], fileName))
+    chunkSize = len(ordered) // _minimumPoolChunkCount
+    chunkSize = max(1, min(_maximumPoolChunkSize, chunkSize))
+    settings = _workerSettings()
+    futures = []
+    for index in range(0, len(ordered), chunkSize):
+        chunk = ordered[index:index + chunkSize]
+        future = pool.submit(_normalizeGLIFChunk, settings, ufoPath, layerDirectory, chunk)
+        futures.append(future)
+    results = {}
+    for future in futures:
+        results.update(future.result())
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        for fileName in fileNames:
+            FILE_SYSTEM_SNAPSHOT.changed(subpathJoin(ufoPath, layerDirectory, fileName))
+    return results
+
+
+def _normalizeGLIFFile(ufoPath, layerDirectory, fileName):
+    log.debug('Normalizing "%s".', os.path.join(layerDirectory, fileName))
+    glifVersionRef = []
+    imageFileName = normalizeGLIF(ufoPath, layerDirectory, fileName,
+                                  glifVersionRef=glifVersionRef)
+    kind = "glif%d" % glifVersionRef[0]
+    modTime = subpathGetChangeToken(ufoPath, layerDirectory, fileName)
+    return imageFileName, (kind, modTime)
+
+
+def _normalizeGLIFFilesOverlapped(ufoPath, layerDirectory, fileNames, ioPool):
+    """
+    Normalize GLIF files in this thread while the I/O
+    thread pool reads the next files and writes the
+    finished ones. Both queues hold at most
+    _maximumIOQueueDepth files. The first error is
+    raised once the pending I/O has finished.
+    """
+    remaining = _readAheadOrder(ufoPath, layerDirectory, fileNames)
+    reads = deque()
+    writes = deque()
+    results = {}
+
+    def readAhead():
+        while len(reads) < _maximumIOQueueDepth:
+            fileName = next(remaining, None)
+            if fileName is None:
+                return
+            future = ioPool.submit(subpathReadBytes, ufoPath, layerDirectory, fileName)
+            reads.append((fileName, future))
+
+    def finishWrite():
+        fileName, imageFileRef, glifVersionRef, future = writes.popleft()
+        imageFileName = imageFileRef[0] if imageFileRef else None
+        kind = "glif%d" % glifVersionRef[0]
+        results[fileName] = imageFileName, (kind, future.result())
+
+    try:
+        readAhead()
+        while reads:
+            fileName, future = reads.popleft()
+            readAhead()
+            data = future.result()
+            log.debug('Normalizing "%s".', os.path.join(layerDirectory, fileName))
+            glifPath = subpathJoin(ufoPath, layerDirectory, fileName)
+            imageFileRef = []
+            glifVersionRef = []
+            normalizedData = normalizeGLIFBytes(data, glifPath, imageFileRef,
+                                                glifVersionRef=glifVersionRef)
+            if len(writes) >= _maximumIOQueueDepth:
+                finishWrite()
+            future = ioPool.submit(_writeGLIFBytes, normalizedData, data,
+                                   ufoPath, layerDirectory, fileName)
+            writes.append((fileName, imageFileRef, glifVersionRef, future))
+        while writes:
+            finishWrite()
+    finally:
+        # never leave I/O running behind an error
+        for _fileName, future in reads:
+            future.cancel()
+        for _fileName, _imageFileRef, _glifVersionRef, future in writes:
+            future.cancel()
+            if not future.cancelled():
+                future.exception()
+    return results
+
+
+def _writeGLIFBytes(normalizedData, data, ufoPath, layerDirectory, fileName):
+    subpathWriteBytes(normalizedData, ufoPath, layerDirectory, fileName, existing=data)
+    return subpathGetChangeToken(ufoPath, layerDirectory, fileName)
+
+
 def normalizeLayerInfoPlist(ufoPath, layerDirectory):
     if subpathExists(ufoPath, layerDirectory, "layerinfo.plist"):
         _normalizePlistFile({}, ufoPath, *[layerDirectory, "layerinfo.plist"],
@@ -375,46 +883,174 @@ def _normalizeLayerInfoColor(obj):
             obj["color"] = color
 
 
-def normalizeGlyphNames(ufoPath, layerDirectory):
+def normalizeGlyphNames(ufoPath, layerDirectory, modTimes=None,
+                        modTimeKey="contents.plist", previousGlyphMapping=None):
     """
     Normalize GLIF file names following
     UFO 3 user name to file name convention.
+
+    If modTimes is given, the digest of the normalized
+    contents.plist is recorded in it under modTimeKey.
+    While the file has the recorded digest, its file
+    names are known to be normalized and the glyph names
+    are not translated again. If previousGlyphMapping is
+    the mapping of the recorded file, only the glyphs that
+    were added or changed since are translated, as long
+    as that gives the same file names as translating all
+    of them. It may also be a function that returns the
+    mapping or None, which is only called if the file
+    has changed.
+    """
+    if not subpathExists(ufoPath, layerDirectory, "contents.plist"):
+        return {}
+    stored = None if modTimes is None else modTimes.get(modTimeKey)
+    if isinstance(stored, tuple) and stored[0] == "contents":
+        if stored[1] == subpathGetHash(ufoPath, layerDirectory, "contents.plist"):
+            return subpathReadPlist(ufoPath, layerDirectory, "contents.plist")
+        if callable(previousGlyphMapping):
+            previousGlyphMapping = previousGlyphMapping()
+    else:
+        previousGlyphMapping = None
+    newGlyphMapping, renames = _glyphNamesPlan(ufoPath, layerDirectory, previousGlyphMapping)
+    for fromFileName, toFileName in renames:
+        subpathRenameFile(ufoPath,
+                          (layerDirectory, fromFileName),
+                          (layerDirectory, toFileName))
+    # update and normalize contents.plist
+    _writeNormalizedPlist(newGlyphMapping, ufoPath, (layerDirectory, "contents.plist"),
+                          removeEmpty=False)
+    if modTimes is not None:
+        modTimes[modTimeKey] = ("contents", subpathGetHash(ufoPath, layerDirectory, "contents.plist"))
+    return newGlyphMapping
+
+
+def _glyphNamesPlan(ufoPath, layerDirectory, previousGlyphMapping=None):
+    """
+    Get the new glyph mapping and the renames
+    that normalizeGlyphNames would make.
     """
     # INVALID DATA POSSIBILITY: no contents.plist
     # INVALID DATA POSSIBILITY: file for glyph name may not exist
     # INVALID DATA POSSIBILITY: file for glyph may not be stored in contents
-    if not subpathExists(ufoPath, layerDirectory, "contents.plist"):
-        return {}
     oldGlyphMapping = subpathReadPlist(ufoPath, layerDirectory, "contents.plist")
+    newGlyphMapping = None
+    if previousGlyphMapping is not None:
+        newGlyphMapping = _foldGlyphNames(oldGlyphMapping, previousGlyphMapping)
+    if newGlyphMapping is None:
+        glyphNames = sorted(oldGlyphMapping.keys())
+        newFileNames = userNamesToFileNames([str(glyphName) for glyphName in glyphNames],
+                                            suffix=".glif")
+        newGlyphMapping = dict(zip(glyphNames, newFileNames))
+    renames = renamePlan(
+        (oldGlyphMapping[glyphName], newFileName)
+        for glyphName, newFileName in sorted(newGlyphMapping.items()))
+    return newGlyphMapping, renames
+
+
+# file names made by handleClash1 and handleClash2
+_clashFileNamePattern = re.compile(r"(\d{15}|^\d+)\.glif$")
+
+
+def _foldGlyphNames(oldGlyphMapping, previousGlyphMapping):
+    """
+    Translate the glyph names of oldGlyphMapping that are
+    not mapped to the same file in previousGlyphMapping, a
+    normalized mapping, and keep the others. None is returned
+    if a file name clashes, as the result could then differ
+    from translating all of the glyph names.
+    """
+    for fileName in previousGlyphMapping.values():
+        if _clashFileNamePattern.search(fileName):
+            return None
     newGlyphMapping = {}
-    newFileNames = set()
-    for glyphName in sorted(oldGlyphMapping.keys()):
-        newFileName = userNameToFileName(str(glyphName), newFileNames, suffix=".glif")
-        newFileNames.add(newFileName.lower())
-        newGlyphMapping[glyphName] = newFileName
-    # don't do a direct rewrite in case an old file has
-    # the same name as a new file.
-    fromTempMapping = {}
-    for index, (glyphName, newFileName) in enumerate(sorted(newGlyphMapping.items())):
-        oldFileName = oldGlyphMapping[glyphName]
-        if newFileName == oldFileName:
-            continue
-        tempFileName = f"org.unifiedfontobject.normalizer.{index}"
-        subpathRenameFile(ufoPath,
-                          (layerDirectory, oldFileName),
-                          (layerDirectory, tempFileName))
-        fromTempMapping[tempFileName] = newFileName
-    for tempFileName, newFileName in fromTempMapping.items():
-        subpathRenameFile(ufoPath,
-                          (layerDirectory, tempFileName),
-                          (layerDirectory, newFileName))
-    # update contents.plist
-    subpathWritePlist(newGlyphMapping, ufoPath, layerDirectory, "contents.plist")
-    # normalize contents.plist
-    _normalizePlistFile({}, ufoPath, layerDirectory, "contents.plist", removeEmpty=False)
+    existing = set()
+    added = []
+    for glyphName, fileName in oldGlyphMapping.items():
+        if previousGlyphMapping.get(glyphName) == fileName:
+            newGlyphMapping[glyphName] = fileName
+            existing.add(fileName.lower())
+        else:
+            added.append(glyphName)
+    fileNames = userNamesToFileNames([str(glyphName) for glyphName in added], suffix=".glif")
+    for glyphName, fileName in zip(added, fileNames):
+        if fileName.lower() in existing or _clashFileNamePattern.search(fileName):
+            return None
+        existing.add(fileName.lower())
+        newGlyphMapping[glyphName] = fileName
     return newGlyphMapping
 
 
+def renamePlan(renames):
+    """
+    Order (oldName, newName) pairs into a list of
+    (fromName, toName) renames that never overwrite
+    a name that is still to be renamed. Names are
+    compared case insensitively, as some file systems
+    do. Names are renamed directly and a temporary
+    name is only used to break a cycle, which
+    includes a change of case only.
+    """
+    pending = OrderedDict((old, new) for old, new in renames if old != new)
+    sources = set(old.lower() for old in pending)
+    # the rename waiting for each name to be freed
+    waiting = {}
+    ready = deque()
+    for old, new in pending.items():
+        if new.lower() in sources:
+            waiting[new.lower()] = old
+        else:
+            ready.append(old)
+    plan = []
+    tempIndex = 0
+    while pending:
+        if ready:
+            old = ready.popleft()
+            new = pending.pop(old)
+            plan.append((old, new))
+        else:
+            # every remaining rename is part of a
+            # cycle, so move one name out of the way
+            old = next(iter(pending))
+            new = pending.pop(old)
+            temp = f"org.unifiedfontobject.normalizer.{tempIndex}"
+            tempIndex += 1
+            plan.append((old, temp))
+            pending[temp] = new
+            waiting[new.lower()] = temp
+        sources.discard(old.lower())
+        unblocked = waiting.pop(old.lower(), None)
+        if unblocked is not None:
+            ready.append(unblocked)
+    return plan
+
+
+def renamePlanReport(ufoPath):
+    """
+    Get the renames that normalizing the UFO would make
+    as (fromSubpath, toSubpath) pairs, without making them.
+    Glyph file renames are given in the current directories.
+    """
+    report = []
+    metaInfo = subpathReadPlist(ufoPath, "metainfo.plist")
+    if int(metaInfo.get("formatVersion", 3)) < 3:
+        layerDirectories = ["glyphs"]
+    else:
+        layerDirectories = []
+        plan = _glyphsDirectoryNamesPlan(ufoPath)
+        if plan is not None:
+            oldLayerMapping, _newLayerMapping, renames = plan
+            report.extend(renames)
+            layerDirectories = list(oldLayerMapping.values())
+    for layerDirectory in layerDirectories:
+        if not subpathExists(ufoPath, layerDirectory, "contents.plist"):
+            continue
+        _newGlyphMapping, renames = _glyphNamesPlan(ufoPath, layerDirectory)
+        for fromFileName, toFileName in renames:
+            report.append((subpathJoin(layerDirectory, fromFileName),
+                           subpathJoin(layerDirectory, toFileName)))
+    return report
+
+
 def _test_normalizeGlyphNames(oldGlyphMapping, expectedGlyphMapping):
     import tempfile
     directory = tempfile.mkdtemp()
@@ -434,6 +1070,154 @@ def _test_normalizeGlyphNames(oldGlyphMapping, expectedGlyphMapping):
     return newGlyphMapping == expectedGlyphMapping
 
 
+# -------------------
+# Parallel Processing
+# -------------------
+
+_minimumPoolBatchSize = 16
+_minimumPoolChunkCount = 64
+_maximumPoolChunkSize = 64
+_maximumConcurrentUnits = 32
+_maximumIOQueueDepth = 64
+
+
+@contextmanager
+def _processPool(workers):
+    """
+    Create a process pool for the given number of
+    workers. None is yielded if the work should be
+    done serially in this process.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers is None or workers <= 1:
+        yield None
+        return
+    # the platform's default start method is used, see normalizeUFO
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # forked workers are all started by the first task. start
+        # them now, before the I/O and unit threads exist, so that
+        # they never inherit a lock held by one of those threads.
+        pool.submit(os.getpid).result()
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+@contextmanager
+def _ioPool(threads):
+    """
+    Create a thread pool for reading and writing
+    files. None is yielded if there are no threads.
+    """
+    if threads is None or threads <= 0:
+        yield None
+        return
+    ioPool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        yield ioPool
+    finally:
+        ioPool.shutdown()
+
+
+@contextmanager
+def _unitScheduler(concurrent):
+    """
+    Create a scheduler for independent units of work.
+
+    Concurrent units run on a thread pool and leave
+    the CPU bound work to the process pool. Otherwise
+    each unit runs as soon as it is submitted.
+    """
+    if not concurrent:
+        yield _SerialScheduler()
+        return
+    scheduler = ThreadPoolExecutor(max_workers=_maximumConcurrentUnits)
+    try:
+        yield scheduler
+    finally:
+        scheduler.shutdown()
+
+
+class _SerialScheduler(object):
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        future.set_result(function(*args, **kwargs))
+        return future
+
+
+def _workerSettings():
+    """
+    Get the module level settings that
+    must be replicated in worker processes.
+    """
+    return dict(FLOAT_FORMAT=FLOAT_FORMAT, GLIF_ENGINE=GLIF_ENGINE,
+                XML_BACKEND=XML_BACKEND, CHANGE_DETECTION=CHANGE_DETECTION,
+                DURABILITY=DURABILITY, logLevel=log.getEffectiveLevel())
+
+
+def _applyWorkerSettings(settings):
+    """
+    Apply the settings of the parent process in a worker process.
+    """
+    if os.getpid() != _stateProcessID:
+        _resetInheritedState()
+    settings = dict(settings)
+    logLevel = settings.pop("logLevel")
+    globals().update(settings)
+    if not logging.getLogger().handlers:
+        # workers that are not forked don't inherit the configuration
+        logging.basicConfig(level=logLevel, format="%(message)s")
+    log.setLevel(logLevel)
+
+
+# The process that the run time state below belongs to. A
+# forked worker inherits the state of the parent as it was
+# at the time of the fork, which must not be used.
+
+_stateProcessID = os.getpid()
+
+
+def _resetInheritedState():
+    global FILE_SYSTEM_SNAPSHOT, _advisedDescriptors, _advisedDescriptorsLock
+    global _unsyncedPaths, _unsyncedPathsLock, _stateProcessID
+    _stateProcessID = os.getpid()
+    FILE_SYSTEM_SNAPSHOT = None
+    for fd in _advisedDescriptors.values():
+        os.close(fd)
+    _advisedDescriptors = {}
+    _advisedDescriptorsLock = threading.Lock()
+    _unsyncedPaths = set()
+    _unsyncedPathsLock = threading.Lock()
+
+
+def _normalizeGLIFChunk(settings, ufoPath, layerDirectory, fileNames):
+    """
+    Normalize a chunk of GLIF files in a worker process.
+    """
+    _applyWorkerSettings(settings)
+    results = {}
+    for fileName in fileNames:
+        results[fileName] = _normalizeGLIFFile(ufoPath, layerDirectory, fileName)
+    if DURABILITY == "layer":
+        # the parent only syncs the files it wrote itself
+        _syncFiles()
+    return results
+
+
+def _normalizePlistFileChunk(settings, ufoPath, subpath, kwargs):
+    """
+    Normalize a property list file in a worker process.
+    """
+    _applyWorkerSettings(settings)
+    result = _normalizePlistFileContents(ufoPath, subpath, **kwargs)
+    if DURABILITY == "layer":
+        _syncFiles()
+    return result
+
+
 # ---------------
 # Top-Level Files
 # ---------------
@@ -444,20 +1228,51 @@ def _test_normalizeGlyphNames(oldGlyphMapping, expectedGlyphMapping):
 # needs to occur.
 
 def _normalizePlistFile(modTimes, ufoPath, *subpath, **kwargs):
+    pool = kwargs.pop("pool", None)
     if subpathNeedsRefresh(modTimes, ufoPath, *subpath):
-        preprocessor = kwargs.get("preprocessor")
-        data = subpathReadPlist(ufoPath, *subpath)
-        if data:
-            log.debug('Normalizing "%s".', os.path.join(*subpath))
-            text = normalizePropertyList(data, preprocessor=preprocessor)
-            subpathWriteFile(text, ufoPath, *subpath)
-            modTimes[subpath[-1]] = subpathGetModTime(ufoPath, *subpath)
-        elif kwargs.get("removeEmpty", True):
-            # Don't write empty plist files, unless 'removeEmpty' is False
-            log.debug('Removing empty "%s".', os.path.join(*subpath))
-            subpathRemoveFile(ufoPath, *subpath)
-            if subpath[-1] in modTimes:
-                del modTimes[subpath[-1]]
+        if pool is None:
+            modTime = _normalizePlistFileContents(ufoPath, subpath, **kwargs)
+        else:
+            future = pool.submit(_normalizePlistFileChunk, _workerSettings(),
+                                 ufoPath, subpath, kwargs)
+            modTime = future.result()
+            if FILE_SYSTEM_SNAPSHOT is not None:
+                FILE_SYSTEM_SNAPSHOT.changed(subpathJoin(ufoPath, *subpath))
+        if modTime is not None:
+            modTimes[subpath[-1]] = modTime
+        elif subpath[-1] in modTimes:
+            del modTimes[subpath[-1]]
+
+
+def _normalizePlistFileContents(ufoPath, subpath, preprocessor=None, removeEmpty=True):
+    """
+    Normalize a property list file. Returns the file kind and
+    change token of the normalized file or None if it was not
+    written.
+    """
+    data = subpathReadPlist(ufoPath, *subpath)
+    return _writeNormalizedPlist(data, ufoPath, subpath, preprocessor=preprocessor,
+                                 removeEmpty=removeEmpty)
+
+
+def _writeNormalizedPlist(data, ufoPath, subpath, preprocessor=None, removeEmpty=True):
+    """
+    Write a Python object as a normalized property list. This gives
+    the same result as subpathWritePlist followed by _normalizePlistFile
+    without writing, reading and parsing the intermediate file. Returns
+    the same values as _normalizePlistFileContents.
+    """
+    if data:
+        log.debug('Normalizing "%s".', os.path.join(*subpath))
+        text = normalizePropertyList(data, preprocessor=preprocessor)
+        subpathWriteFile(text, ufoPath, *subpath)
+        kind = os.path.splitext(subpath[-1])[0]
+        return kind, subpathGetChangeToken(ufoPath, *subpath)
+    elif removeEmpty:
+        # Don't write empty plist files, unless 'removeEmpty' is False
+        log.debug('Removing empty "%s".', os.path.join(*subpath))
+        subpathRemoveFile(ufoPath, *subpath)
+    return None
 
 
 # metainfo.plist
@@ -466,9 +1281,9 @@ def normalizeMetaInfoPlist(ufoPath, modTimes):
 
 
 # fontinfo.plist
-def normalizeFontInfoPlist(ufoPath, modTimes):
+def normalizeFontInfoPlist(ufoPath, modTimes, pool=None):
     _normalizePlistFile(modTimes, ufoPath, "fontinfo.plist",
-                        preprocessor=_normalizeFontInfoGuidelines)
+                        preprocessor=_normalizeFontInfoGuidelines, pool=pool)
 
 
 def _normalizeFontInfoGuidelines(obj):
@@ -550,14 +1365,14 @@ def _normalizeDictGuideline(guideline):
 
 # groups.plist
 
-def normalizeGroupsPlist(ufoPath, modTimes):
-    _normalizePlistFile(modTimes, ufoPath, "groups.plist")
+def normalizeGroupsPlist(ufoPath, modTimes, pool=None):
+    _normalizePlistFile(modTimes, ufoPath, "groups.plist", pool=pool)
 
 
 # kerning.plist
 
-def normalizeKerningPlist(ufoPath, modTimes):
-    _normalizePlistFile(modTimes, ufoPath, "kerning.plist")
+def normalizeKerningPlist(ufoPath, modTimes, pool=None):
+    _normalizePlistFile(modTimes, ufoPath, "kerning.plist", pool=pool)
 
 
 # layercontents.plist
@@ -591,8 +1406,46 @@ def normalizePropertyList(data, preprocessor=None):
 
 # GLIF
 
-def normalizeGLIFString(text, glifPath=None, imageFileRef=None):
-    tree = ET.fromstring(text)
+def normalizeGLIFString(text, glifPath=None, imageFileRef=None, engine=None,
+                        glifVersionRef=None):
+    """
+    Normalize the text of a GLIF file.
+
+    If glifVersionRef is a list, it receives the GLIF format version.
+
+    engine is one of GLIF_ENGINES. If it is None, the
+    module level GLIF_ENGINE is used. The tree engine
+    is the reference implementation. The expat engine
+    follows the same rules in a single streaming pass.
+    """
+    writer = _normalizeGLIF(text, glifPath, imageFileRef, engine, glifVersionRef)
+    return writer.getText()
+
+
+def normalizeGLIFBytes(data, glifPath=None, imageFileRef=None, engine=None,
+                       glifVersionRef=None):
+    """
+    Normalize the raw bytes of a GLIF file and
+    return the normalized file as UTF-8 bytes.
+
+    The data is parsed without decoding it first.
+    The arguments are the same as normalizeGLIFString.
+    """
+    writer = _normalizeGLIF(data, glifPath, imageFileRef, engine, glifVersionRef)
+    return writer.getBytes()
+
+
+def _normalizeGLIF(source, glifPath, imageFileRef, engine, glifVersionRef):
+    """
+    Normalize GLIF text or bytes into an XMLWriter.
+    """
+    if engine is None:
+        engine = GLIF_ENGINE
+    if engine == "expat":
+        return _normalizeGLIFExpat(source, glifPath, imageFileRef, glifVersionRef)
+    elif engine != "tree":
+        raise UFONormalizerError(f"Unknown GLIF engine: {engine}")
+    tree = _xmlFromString(source)
     glifVersion = tree.attrib.get("format")
     if glifVersion is None:
         msg = "Undefined GLIF format"
@@ -600,6 +1453,8 @@ def normalizeGLIFString(text, glifPath=None, imageFileRef=None):
             msg += ": %s" % glifPath
         raise UFONormalizerError(msg)
     glifVersion = int(glifVersion)
+    if glifVersionRef is not None:
+        glifVersionRef[:] = [glifVersion]
     name = tree.attrib.get("name")
     # start the writer
     writer = XMLWriter()
@@ -641,7 +1496,7 @@ def normalizeGLIFString(text, glifPath=None, imageFileRef=None):
     if advance is not None:
         _normalizeGlifAdvance(advance, writer)
     if glifVersion >= 2 and image is not None:
-        imageFileRef[:] = image.attrib.get("fileName")
+        imageFileRef[:] = [image.attrib.get("fileName")]
         _normalizeGlifImage(image, writer)
     if outline is not None:
         if glifVersion == 1:
@@ -660,10 +1515,10 @@ def normalizeGLIFString(text, glifPath=None, imageFileRef=None):
         _normalizeGlifNote(note, writer)
     writer.endElement("glyph")
     writer.raw("")
-    return writer.getText()
+    return writer
 
 
-def normalizeGLIF(ufoPath, *subpath):
+def normalizeGLIF(ufoPath, *subpath, glifVersionRef=None):
     """
     - Normalize the mark color if specified.
 
@@ -679,10 +1534,11 @@ def normalizeGLIF(ufoPath, *subpath):
     # INVALID DATA POSSIBILITY: format version that can't be converted to int
     # read and parse
     glifPath = subpathJoin(ufoPath, *subpath)
-    text = subpathReadFile(ufoPath, *subpath)
+    data = subpathReadBytes(ufoPath, *subpath)
     imageFileRef = []
-    normalizedText = normalizeGLIFString(text, glifPath, imageFileRef)
-    subpathWriteFile(normalizedText, ufoPath, *subpath)
+    normalizedData = normalizeGLIFBytes(data, glifPath, imageFileRef,
+                                        glifVersionRef=glifVersionRef)
+    subpathWriteBytes(normalizedData, ufoPath, *subpath, existing=data)
     # return the image reference
     imageFileName = imageFileRef[0] if imageFileRef else None
     return imageFileName
@@ -1156,22 +2012,34 @@ def _dateToString(data):
             f'{data.minute:02d}:{data.second:02d}Z')
 
 
-def _convertPlistElementToObject(element):
+def _convertPlistElementToObject(element, strict=False):
+    """
+    If strict is True, a ValueError is raised for structures
+    that plistlib would report or read differently.
+    """
     # INVALID DATA POSSIBILITY: invalid value string
     obj = None
     tag = element.tag
     if tag == "array":
         obj = []
         for subElement in element:
-            obj.append(_convertPlistElementToObject(subElement))
+            obj.append(_convertPlistElementToObject(subElement, strict))
     elif tag == "dict":
         obj = {}
         key = None
         for subElement in element:
             if subElement.tag == "key":
-                key = subElement.text
+                if strict and key is not None:
+                    raise ValueError("missing value for key '%s'" % key)
+                key = subElement.text or ""
+            elif strict and key is None:
+                raise ValueError("missing key for value <%s>" % subElement.tag)
             else:
-                obj[key] = _convertPlistElementToObject(subElement)
+                obj[key] = _convertPlistElementToObject(subElement, strict)
+                if strict:
+                    key = None
+        if strict and key is not None:
+            raise ValueError("missing value for key '%s'" % key)
     elif tag == "string":
         if not element.text:
             return ""
@@ -1190,9 +2058,299 @@ def _convertPlistElementToObject(element):
         return float(element.text)
     elif tag == "integer":
         return int(element.text)
+    elif strict:
+        raise ValueError("unknown element <%s>" % tag)
     return obj
 
 
+# Streaming GLIF
+
+def _normalizeGLIFExpat(source, glifPath=None, imageFileRef=None, glifVersionRef=None):
+    """
+    Normalize the text or bytes of a GLIF file into an XMLWriter
+    in a single pass over expat events without building an
+    element tree.
+    """
+    normalizer = _ExpatGLIFNormalizer(glifPath)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = normalizer.startElement
+    parser.EndElementHandler = normalizer.endElement
+    parser.CharacterDataHandler = normalizer.characterData
+    try:
+        parser.Parse(source, True)
+    except expat.ExpatError as error:
+        # match the exception raised by the tree engine
+        raise ET.ParseError(str(error)) from None
+    if imageFileRef is None:
+        imageFileRef = []
+    if glifVersionRef is not None:
+        glifVersionRef[:] = [normalizer.glifVersion]
+    return normalizer.getWriter(imageFileRef)
+
+
+class _ExpatGLIFNormalizer(object):
+
+    """
+    Collect the top-level elements of a GLIF from expat
+    events. Points are formatted as soon as they are read,
+    following the same rules as _normalizeGlifPointAttributesFormat1
+    and _normalizeGlifPointAttributesFormat2, so no per-point
+    element or dict is created. The less frequent elements are
+    handed to the tree engine functions so that the output is
+    identical.
+    """
+
+    def __init__(self, glifPath=None):
+        self.glifPath = glifPath
+        self.glifVersion = None
+        self.name = None
+        self.advance = None
+        self.unicodes = []
+        self.note = None
+        self.image = None
+        self.guidelines = []
+        self.anchors = []
+        self.outline = None
+        self.lib = None
+        self._depth = 0
+        self._topLevelTag = None
+        self._noteText = None
+        self._libBuilder = None
+        self._outlineItems = None
+        self._outlineAnchors = None
+        self._contourAttrib = None
+        self._contourPoints = None
+        self._firstPointAttrib = None
+
+    # events
+
+    def startElement(self, tag, attrib):
+        depth = self._depth
+        self._depth = depth + 1
+        if self._libBuilder is not None:
+            self._libBuilder.start(tag, attrib)
+        elif depth == 0:
+            self._startGlyph(attrib)
+        elif depth == 1:
+            self._topLevelTag = tag
+            if tag == "advance":
+                self.advance = attrib
+            elif tag == "unicode":
+                self.unicodes.append(attrib)
+            elif tag == "note":
+                self._noteText = []
+            elif tag == "image":
+                self.image = attrib
+            elif tag == "guideline":
+                self.guidelines.append(attrib)
+            elif tag == "anchor":
+                self.anchors.append(attrib)
+            elif tag == "outline":
+                self._outlineItems = []
+                self._outlineAnchors = []
+            elif tag == "lib":
+                self._libBuilder = ET.TreeBuilder()
+                self._libBuilder.start(tag, attrib)
+        elif self._topLevelTag == "outline":
+            if depth == 2:
+                if tag == "contour":
+                    self._contourAttrib = attrib
+                    self._contourPoints = []
+                elif tag == "component":
+                    self._addComponent(attrib)
+            elif depth == 3 and tag == "point" and self._contourPoints is not None:
+                self._addPoint(attrib)
+        elif self._topLevelTag == "note" and depth == 2:
+            # the note is the text before the first child
+            self.note = "".join(self._noteText)
+            self._noteText = None
+
+    def endElement(self, tag):
+        self._depth -= 1
+        depth = self._depth
+        if self._libBuilder is not None:
+            self._libBuilder.end(tag)
+            if depth == 1:
+                self.lib = self._libBuilder.close()
+                self._libBuilder = None
+        elif depth == 1:
+            if tag == "outline":
+                self.outline = (self._outlineItems, self._outlineAnchors)
+            elif tag == "note" and self._noteText is not None:
+                self.note = "".join(self._noteText)
+            self._topLevelTag = None
+            self._noteText = None
+        elif depth == 2 and tag == "contour" and self._topLevelTag == "outline":
+            self._endContour()
+
+    def characterData(self, data):
+        if self._libBuilder is not None:
+            self._libBuilder.data(data)
+        elif self._noteText is not None:
+            self._noteText.append(data)
+
+    # glyph
+
+    def _startGlyph(self, attrib):
+        glifVersion = attrib.get("format")
+        if glifVersion is None:
+            msg = "Undefined GLIF format"
+            if self.glifPath is not None:
+                msg += ": %s" % self.glifPath
+            raise UFONormalizerError(msg)
+        self.glifVersion = int(glifVersion)
+        self.name = attrib.get("name")
+
+    # outline
+
+    def _addComponent(self, attrib):
+        element = ET.Element("component", attrib)
+        if self.glifVersion == 1:
+            component = _normalizeGlifComponentFormat1(element)
+        else:
+            component = _normalizeGlifComponentFormat2(element)
+        if component:
+            del component["type"]
+            self._outlineItems.append(component)
+
+    def _addPoint(self, attrib):
+        points = self._contourPoints
+        if points is _invalidContour:
+            return
+        if not points:
+            self._firstPointAttrib = attrib
+        point = _formatGlifPointAttributes(attrib, self.glifVersion)
+        if point is None:
+            # an invalid point invalidates the whole contour
+            self._contourPoints = _invalidContour
+        else:
+            points.append(point)
+
+    def _endContour(self):
+        points = self._contourPoints
+        attrib = self._contourAttrib
+        firstPointAttrib = self._firstPointAttrib
+        self._contourPoints = self._contourAttrib = self._firstPointAttrib = None
+        if points is _invalidContour or not points:
+            return
+        if self.glifVersion == 1:
+            # a single move point is an implied anchor
+            if len(points) == 1 and firstPointAttrib.get("type") == "move":
+                anchor = _normalizeGlifPointAttributesFormat1(
+                    ET.Element("point", firstPointAttrib))
+                self._outlineAnchors.append(anchor)
+                return
+            contourAttrs = None
+        else:
+            contourAttrs = {}
+            identifier = attrib.get("identifier")
+            if identifier is not None:
+                contourAttrs["identifier"] = identifier
+        self._outlineItems.append((contourAttrs, points))
+
+    def _writeOutline(self, writer):
+        items, anchors = self.outline
+        if not items and not anchors:
+            return
+        writer.beginElement("outline")
+        for item in items:
+            if isinstance(item, tuple):
+                contourAttrs, points = item
+                writer.beginElement("contour", attrs=contourAttrs)
+                for point in points:
+                    writer.raw("<point %s/>" % point)
+                writer.endElement("contour")
+            else:
+                writer.simpleElement("component", attrs=item)
+        for anchor in anchors:
+            writer.beginElement("contour")
+            attrs = dict(
+                type="move",
+                x=anchor["x"],
+                y=anchor["y"]
+            )
+            if "name" in anchor:
+                attrs["name"] = anchor["name"]
+            writer.simpleElement("point", attrs=attrs)
+            writer.endElement("contour")
+        writer.endElement("outline")
+
+    # output
+
+    def getWriter(self, imageFileRef):
+        glifVersion = self.glifVersion
+        writer = XMLWriter()
+        writer.beginElement("glyph", attrs=dict(name=self.name, format=glifVersion))
+        for attrib in self.unicodes:
+            _normalizeGlifUnicode(ET.Element("unicode", attrib), writer)
+        if self.advance is not None:
+            _normalizeGlifAdvance(ET.Element("advance", self.advance), writer)
+        if glifVersion >= 2 and self.image is not None:
+            imageFileRef[:] = [self.image.get("fileName")]
+            _normalizeGlifImage(ET.Element("image", self.image), writer)
+        if self.outline is not None:
+            self._writeOutline(writer)
+        if glifVersion >= 2:
+            for attrib in self.anchors:
+                _normalizeGlifAnchor(ET.Element("anchor", attrib), writer)
+            for attrib in self.guidelines:
+                _normalizeGlifGuideline(ET.Element("guideline", attrib), writer)
+        if self.lib is not None:
+            _normalizeGlifLib(self.lib, writer)
+        if self.note is not None:
+            note = ET.Element("note")
+            note.text = self.note
+            _normalizeGlifNote(note, writer)
+        writer.endElement("glyph")
+        writer.raw("")
+        return writer
+
+
+_invalidContour = object()
+_glifPointTypes = frozenset(("move", "line", "curve", "qcurve", "offcurve"))
+
+
+def _formatGlifPointAttributes(attrib, glifVersion):
+    """
+    Format the attributes of a point as a string.
+    Returns None if the point invalidates its contour.
+
+    This is the streaming equivalent of writing the result of
+    _normalizeGlifPointAttributesFormat1 (glifVersion 1) or
+    _normalizeGlifPointAttributesFormat2 with XMLWriter.
+    """
+    identifier = None
+    if glifVersion != 1:
+        identifier = attrib.get("identifier")
+    x = attrib.get("x")
+    y = attrib.get("y")
+    typ = attrib.get("type", "offcurve")
+    if not x or not y or typ not in _glifPointTypes:
+        # format 2 keeps the identifier of an otherwise empty point
+        if identifier is None:
+            return None
+        return "identifier=\"%s\"" % xmlEscapeText(identifier)
+    try:
+        x = xmlConvertNumberString(x)
+        y = xmlConvertNumberString(y)
+    except ValueError:
+        return None
+    name = attrib.get("name")
+    if name is not None:
+        text = "name=\"%s\" x=\"%s\" y=\"%s\"" % (xmlEscapeText(name), x, y)
+    else:
+        text = "x=\"%s\" y=\"%s\"" % (x, y)
+    if typ != "offcurve":
+        if attrib.get("smooth") == "yes":
+            text += " type=\"%s\" smooth=\"yes\"" % typ
+        else:
+            text += " type=\"%s\"" % typ
+    if identifier is not None:
+        text += " identifier=\"%s\"" % xmlEscapeText(identifier)
+    return text
+
+
 # XML Writer
 xmlDeclaration = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
 plistDocType = ("<!DOCTYPE plist PUBLIC \"-//Apple//DTD PLIST 1.0//EN\" "
@@ -1242,6 +2400,9 @@ class XMLWriter(object):
         assert not self._stack
         return xmlLineBreak.join(self._lines)
 
+    def getBytes(self):
+        return self.getText().encode("utf-8")
+
     # writing
 
     def raw(self, line):
@@ -1390,16 +2551,31 @@ class XMLWriter(object):
           place them after the known attributes.
         - Format as space separated name="value".
         """
-        sorter = [
-            (xmlAttributeOrder.get(attr, 100), attr, value) for (attr, value) in attrs.items()
-        ]
-        formatted = []
-        for _index, attr, value in sorted(sorter):
-            attr = xmlEscapeAttribute(attr)
-            value = xmlConvertValue(value)
-            pair = "%s=\"%s\"" % (attr, value)
-            formatted.append(pair)
-        return " ".join(formatted)
+        keys = tuple(attrs)
+        plan = _attributeOrderPlans.get(keys)
+        if plan is None:
+            plan = _attributeOrderPlan(keys)
+        order, template = plan
+        return template % tuple([xmlConvertValue(attrs[attr]) for attr in order])
+
+
+# Elements only use a few distinct sets of attributes, so the
+# sorted order and the escaped names are worked out once for
+# each tuple of keys, as given, and kept as a format string.
+
+_maximumAttributeOrderPlans = 1 << 10
+_attributeOrderPlans = {}
+
+
+def _attributeOrderPlan(keys):
+    order = tuple(sorted(keys, key=lambda attr: (xmlAttributeOrder.get(attr, 100), attr)))
+    template = " ".join(
+        "%s=\"%%s\"" % xmlEscapeAttribute(attr).replace("%", "%%") for attr in order
+    )
+    if len(_attributeOrderPlans) >= _maximumAttributeOrderPlans:
+        _attributeOrderPlans.clear()
+    plan = _attributeOrderPlans[keys] = (order, template)
+    return plan
 
 
 def xmlEscapeText(text):
@@ -1426,6 +2602,44 @@ def xmlConvertValue(value):
 
 
 def xmlConvertFloat(value):
+    global _numberMemoHits, _numberMemoMisses
+    if not value:
+        # 0.0 and -0.0 are equal keys but may be formatted differently
+        return _formatFloat(value)
+    memo = _numberMemo()
+    string = memo.get(value)
+    if string is not None:
+        _numberMemoHits += 1
+        return string
+    _numberMemoMisses += 1
+    string = memo[value] = _formatFloat(value)
+    return string
+
+
+def xmlConvertNumberString(string):
+    """
+    Convert the string of a number, as found in an
+    attribute, to the string xmlConvertFloat gives for
+    its float value. A ValueError is raised if it is
+    not a number, as float does.
+    """
+    global _numberMemoHits, _numberMemoMisses
+    memo = _numberMemo()
+    result = memo.get(string)
+    if result is not None:
+        _numberMemoHits += 1
+        return result
+    _numberMemoMisses += 1
+    if _canonicalIntegerRE.match(string):
+        # exactly representable and already normalized
+        result = string
+    else:
+        result = _formatFloat(float(string))
+    memo[string] = result
+    return result
+
+
+def _formatFloat(value):
     if FLOAT_FORMAT is None:
         string = repr(value)
         if "e" in string:
@@ -1439,6 +2653,32 @@ def xmlConvertFloat(value):
     return string
 
 
+# Memo of normalized number strings for each FLOAT_FORMAT, keyed
+# by the float value and by the raw attribute string. A full
+# memo is replaced by an empty one.
+
+_maximumNumberMemoSize = 1 << 16
+_canonicalIntegerRE = re.compile(r"(?:0|-?[1-9][0-9]{0,14})\Z")
+_numberMemos = {}
+_numberMemoHits = 0
+_numberMemoMisses = 0
+
+
+def _numberMemo():
+    memo = _numberMemos.get(FLOAT_FORMAT)
+    if memo is None or len(memo) >= _maximumNumberMemoSize:
+        memo = _numberMemos[FLOAT_FORMAT] = {}
+    return memo
+
+
+def numberMemoStatistics():
+    """
+    Get the number of hits and misses of the
+    number memo in this process as a tuple.
+    """
+    return _numberMemoHits, _numberMemoMisses
+
+
 def xmlConvertInt(value):
     return str(value)
 
@@ -1513,6 +2753,335 @@ def duplicateUFO(inPath, outPath):
     shutil.copytree(inPath, outPath)
 
 
+def cloneUFO(inPath, outPath, hardlinks=False, exclude=()):
+    """
+    Duplicate an entire UFO into a new directory,
+    leaving out the paths in exclude. The files are
+    hard linked if hardlinks is True and otherwise
+    copied with copy_file_range where it is available,
+    which shares the data instead on file systems with
+    reflinks, and with shutil.copyfile if it isn't.
+    """
+    exclude = set(os.path.abspath(path) for path in exclude)
+    with os.scandir(inPath) as entries:
+        entries = list(entries)
+    os.mkdir(outPath)
+    for entry in entries:
+        if os.path.abspath(entry.path) in exclude:
+            continue
+        destination = os.path.join(outPath, entry.name)
+        if entry.is_dir():
+            cloneUFO(entry.path, destination, hardlinks=hardlinks, exclude=exclude)
+        else:
+            _cloneFile(entry.path, destination, hardlinks)
+    shutil.copystat(inPath, outPath)
+
+
+def _cloneFile(source, destination, hardlink):
+    if hardlink:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    if not _copyFileRange(source, destination):
+        shutil.copyfile(source, destination)
+    shutil.copystat(source, destination)
+
+
+def _copyFileRange(source, destination):
+    """
+    Copy a file with copy_file_range, which shares the data
+    on file systems with reflinks, such as Btrfs and XFS.
+    Returns False if the file must be copied otherwise.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    with open(source, "rb") as inFile, open(destination, "wb") as outFile:
+        remaining = os.fstat(inFile.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(inFile.fileno(), outFile.fileno(), remaining)
+                if not copied:
+                    break
+                remaining -= copied
+        except OSError as error:
+            # not supported by the kernel or between these file systems
+            if error.errno in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP):
+                return False
+            raise
+    return True
+
+
+@contextmanager
+def _stagedOutput(ufoPath, outputPath, hardlinks):
+    """
+    Clone the UFO next to outputPath and yield the path of
+    the clone. When the block succeeds the clone replaces
+    outputPath, otherwise it is removed and outputPath is
+    left untouched.
+
+    An existing outputPath is first renamed aside and the
+    clone is then renamed to outputPath, so for a moment
+    there is nothing at outputPath. Every file is cloned,
+    including the ones that will be rewritten. Unless the
+    files are hard linked or the file system shares the
+    data of copies, the data of those files is written
+    once by the copy and again by the normalization.
+    """
+    outputPath = os.path.normpath(outputPath)
+    stagingPath = "%s.%d.tmp" % (outputPath, os.getpid())
+    if os.path.exists(stagingPath):
+        shutil.rmtree(stagingPath)
+    try:
+        cloneUFO(ufoPath, stagingPath, hardlinks=hardlinks, exclude=(outputPath, stagingPath))
+        yield stagingPath
+    except BaseException:
+        shutil.rmtree(stagingPath, ignore_errors=True)
+        raise
+    if os.path.lexists(outputPath):
+        oldPath = stagingPath + ".old"
+        os.rename(outputPath, oldPath)
+        os.rename(stagingPath, outputPath)
+        if os.path.isdir(oldPath) and not os.path.islink(oldPath):
+            shutil.rmtree(oldPath)
+        else:
+            os.remove(oldPath)
+    else:
+        os.rename(stagingPath, outputPath)
+    if DURABILITY != "none":
+        _syncDirectory(os.path.dirname(os.path.abspath(outputPath)))
+
+
+# snapshot
+
+FILE_SYSTEM_SNAPSHOT = None
+
+
+@contextmanager
+def _fileSystemSnapshot():
+    """
+    Serve the file system queries of the subpath
+    functions from a _FileSystemSnapshot.
+    """
+    global FILE_SYSTEM_SNAPSHOT
+    FILE_SYSTEM_SNAPSHOT = _FileSystemSnapshot()
+    try:
+        yield FILE_SYSTEM_SNAPSHOT
+    finally:
+        FILE_SYSTEM_SNAPSHOT = None
+
+
+_unknownEntry = object()
+
+
+class _FileSystemSnapshot(object):
+
+    """
+    Directory listings and stat results for one normalization run.
+
+    Each directory is listed with a single os.scandir call the first
+    time it is queried and the stat results are cached. The
+    normalizer must report the files that it writes, removes or
+    renames with changed, removed and renamed. A changed file is
+    stat'ed again the next time it is queried. Files written by
+    worker processes are reported by the parent process. A name
+    that is not in the listing is looked up with os.stat, since
+    it may differ only in case on a case insensitive file system.
+
+    The snapshot also keeps the raw bytes and the parsed object
+    of every property list read during the run, so that each one
+    is parsed at most once. Any change to a path drops them.
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self._digests = {}
+        self._contents = {}
+        self._plists = {}
+        self._lock = threading.RLock()
+
+    def _listing(self, directory):
+        listing = self._listings.get(directory)
+        if listing is None:
+            listing = {}
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        listing[entry.name] = entry
+            except (FileNotFoundError, NotADirectoryError):
+                listing = {}
+            with self._lock:
+                listing = self._listings.setdefault(directory, listing)
+        return listing
+
+    def _record(self, path):
+        """
+        Get the stat result for a path or
+        None if the path does not exist.
+        """
+        directory, name = os.path.split(path)
+        listing = self._listing(directory)
+        record = listing.get(name)
+        if record is None:
+            # on a case insensitive file system the name may differ
+            # in case from the listed one, so confirm the miss
+            try:
+                return os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+        if isinstance(record, os.stat_result):
+            return record
+        try:
+            if record is _unknownEntry:
+                record = os.stat(path)
+            else:
+                record = record.stat()
+        except FileNotFoundError:
+            with self._lock:
+                listing.pop(name, None)
+            return None
+        listing[name] = record
+        return record
+
+    # queries
+
+    def exists(self, path):
+        directory, name = os.path.split(path)
+        record = self._listing(directory).get(name)
+        if record is None or record is _unknownEntry:
+            record = self._record(path)
+        return record is not None
+
+    def stat(self, path):
+        record = self._record(path)
+        if record is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return record
+
+    def signature(self, path):
+        record = self._record(path)
+        if record is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return _statSignature(record)
+
+    def listDirectory(self, directory):
+        """
+        Get a dict of names and booleans indicating
+        if the name is a directory.
+        """
+        listing = self._listing(directory)
+        result = {}
+        for name in list(listing):
+            record = listing.get(name)
+            if isinstance(record, os.DirEntry):
+                result[name] = record.is_dir()
+            else:
+                record = self._record(os.path.join(directory, name))
+                if record is not None:
+                    result[name] = statModule.S_ISDIR(record.st_mode)
+        return result
+
+    def signatures(self, directory):
+        signatures = {}
+        for name, isDirectory in self.listDirectory(directory).items():
+            if not isDirectory:
+                record = self._record(os.path.join(directory, name))
+                if record is not None:
+                    signatures[name] = _statSignature(record)
+        return signatures
+
+    def digest(self, path):
+        """
+        Get the digest of the contents of a file that was
+        stored during this run or None if it is not known.
+        """
+        stored = self._digests.get(path)
+        if stored is None:
+            return None
+        signature, digest = stored
+        record = self._record(path)
+        if record is None or _statSignature(record) != signature:
+            return None
+        return digest
+
+    def readPlist(self, path):
+        """
+        Get a copy of the parsed contents of a property list.
+        """
+        obj = self._plists.get(path, _unknownEntry)
+        if obj is _unknownEntry:
+            data = _readFile(path)
+            obj = _loads(data)
+            with self._lock:
+                self._contents[path] = data
+                self._plists[path] = obj
+        return _copyPlistObject(obj)
+
+    def contents(self, path):
+        """
+        Get the raw bytes of a file that were read
+        during this run or None if they are not known.
+        """
+        return self._contents.get(path)
+
+    def storeDigest(self, path, digest):
+        record = self._record(path)
+        if record is not None:
+            self._digests[path] = (_statSignature(record), digest)
+
+    # changes
+
+    def changed(self, path):
+        directory, name = os.path.split(path)
+        with self._lock:
+            self._digests.pop(path, None)
+            self._contents.pop(path, None)
+            self._plists.pop(path, None)
+            listing = self._listings.get(directory)
+            if listing is not None:
+                listing[name] = _unknownEntry
+            self._forgetDirectory(path)
+
+    def removed(self, path):
+        directory, name = os.path.split(path)
+        with self._lock:
+            self._digests.pop(path, None)
+            self._contents.pop(path, None)
+            self._plists.pop(path, None)
+            listing = self._listings.get(directory)
+            if listing is not None:
+                listing.pop(name, None)
+            self._forgetDirectory(path)
+
+    def renamed(self, fromPath, toPath):
+        with self._lock:
+            self.removed(fromPath)
+            self.changed(toPath)
+
+    def _forgetDirectory(self, path):
+        prefix = os.path.join(path, "")
+        for directory in list(self._listings):
+            if directory == path or directory.startswith(prefix):
+                del self._listings[directory]
+        for cache in (self._contents, self._plists):
+            for filePath in list(cache):
+                if filePath.startswith(prefix):
+                    del cache[filePath]
+
+
+def _copyPlistObject(obj):
+    """
+    Copy the containers of a property list object.
+    The other values are immutable and are shared.
+    """
+    if isinstance(obj, dict):
+        return {key: _copyPlistObject(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [_copyPlistObject(value) for value in obj]
+    return obj
+
+
 def subpathJoin(ufoPath, *subpath):
     """
     Join path parts.
@@ -1534,9 +3103,30 @@ def subpathExists(ufoPath, *subpath):
     Get a boolean indicating if a path exists.
     """
     path = subpathJoin(ufoPath, *subpath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.exists(path)
     return os.path.exists(path)
 
 
+def subpathListDirectory(ufoPath, *subpath):
+    """
+    Get a dict of the names in a directory and booleans
+    indicating if the name is a directory. A directory
+    that doesn't exist is empty.
+    """
+    path = subpathJoin(ufoPath, *subpath) if subpath else ufoPath
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.listDirectory(path)
+    listing = {}
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                listing[entry.name] = entry.is_dir()
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return listing
+
+
 # read
 
 def subpathReadFile(ufoPath, *subpath):
@@ -1544,19 +3134,107 @@ def subpathReadFile(ufoPath, *subpath):
     Read the contents of a file.
     """
     path = subpathJoin(ufoPath, *subpath)
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
+    text = _readFile(path).decode("utf-8")
+    # universal newlines, like a file opened in text mode
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
     return text
 
 
+def subpathReadBytes(ufoPath, *subpath):
+    """
+    Read the raw contents of a file.
+    """
+    path = subpathJoin(ufoPath, *subpath)
+    return _readFile(path)
+
+
+# Linux fast path. The files that are about to be normalized
+# are opened ahead and announced to the kernel, so that it reads
+# them while the previous ones are processed. The descriptor is
+# kept open and the read of the file then uses it.
+
+_linuxFastPath = sys.platform.startswith("linux") and hasattr(os, "posix_fadvise")
+_readAheadWindow = 64
+_advisedDescriptors = {}
+_advisedDescriptorsLock = threading.Lock()
+
+
+def _readFile(path):
+    with _advisedDescriptorsLock:
+        fd = _advisedDescriptors.pop(path, None)
+    with open(path if fd is None else fd, "rb") as f:
+        return f.read()
+
+
+def subpathAdviseWillNeed(ufoPath, *subpath):
+    """
+    Tell the kernel that a file will be read soon.
+    The next read of the file uses the descriptor
+    that was opened for this.
+    This does nothing on other platforms than Linux.
+    """
+    if not _linuxFastPath:
+        return
+    path = subpathJoin(ufoPath, *subpath)
+    if path in _advisedDescriptors:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    with _advisedDescriptorsLock:
+        if path not in _advisedDescriptors:
+            _advisedDescriptors[path] = fd
+            return
+    os.close(fd)
+
+
+def _closeAdvisedDescriptor(path):
+    with _advisedDescriptorsLock:
+        fd = _advisedDescriptors.pop(path, None)
+    if fd is not None:
+        os.close(fd)
+
+
+def _readAheadOrder(ufoPath, directory, fileNames):
+    """
+    Yield the file names in the order of the directory
+    listing, which usually follows the order on disk,
+    and announce the next window of files before the
+    current window is processed. The descriptors of
+    files that were not read are closed at the end.
+    """
+    if not _linuxFastPath:
+        for fileName in fileNames:
+            yield fileName
+        return
+    positions = {name: index for index, name in enumerate(subpathListDirectory(ufoPath, directory))}
+    ordered = sorted(fileNames, key=lambda fileName: positions.get(fileName, len(positions)))
+    try:
+        for index, fileName in enumerate(ordered):
+            if index % _readAheadWindow == 0:
+                start = index + _readAheadWindow if index else 0
+                for upcoming in ordered[start:index + 2 * _readAheadWindow]:
+                    subpathAdviseWillNeed(ufoPath, directory, upcoming)
+            yield fileName
+    finally:
+        for fileName in ordered:
+            _closeAdvisedDescriptor(subpathJoin(ufoPath, directory, fileName))
+
+
 def subpathReadPlist(ufoPath, *subpath):
     """
     Read the contents of a property list
     and convert it into a Python object.
     """
-    path = subpathJoin(ufoPath, *subpath)
-    with open(path, "rb") as f:
-        data = f.read()
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.readPlist(subpathJoin(ufoPath, *subpath))
+    data = subpathReadBytes(ufoPath, *subpath)
     return _loads(data)
 
 
@@ -1570,16 +3248,167 @@ def subpathWriteFile(text, ufoPath, *subpath):
     file contains data that is different
     from the new data.
     """
+    # always use Unix LF end of lines
+    return subpathWriteBytes(text.encode("utf-8"), ufoPath, *subpath)
+
+
+def subpathWriteBytes(data, ufoPath, *subpath, existing=None):
+    """
+    Write bytes to a file.
+
+    This will only modify the file if its contents
+    are different from the new data. The sizes are
+    compared first, then the bytes or the digest of
+    the file if they are known for this run and only
+    then the bytes read from the file. If the current
+    contents of the file are already in memory, they
+    can be given as existing and are compared instead.
+    Returns a boolean indicating if the file was written.
+
+    The data is written to a temporary file that then
+    replaces the file, so an interrupted run never
+    leaves a truncated file. See DURABILITY_POLICIES.
+    """
     path = subpathJoin(ufoPath, *subpath)
-    if subpathExists(ufoPath, *subpath):
-        existing = subpathReadFile(ufoPath, *subpath)
-    else:
-        existing = None
+    if existing is not None:
+        if existing == data:
+            return False
+    elif subpathExists(ufoPath, *subpath) and subpathGetSize(ufoPath, *subpath) == len(data):
+        if not _contentsDiffer(data, path):
+            return False
+    _replaceFile(path, data, sync=DURABILITY == "file")
+    if DURABILITY == "layer":
+        with _unsyncedPathsLock:
+            _unsyncedPaths.add(path)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        FILE_SYSTEM_SNAPSHOT.changed(path)
+        FILE_SYSTEM_SNAPSHOT.storeDigest(path, _digest(data))
+    return True
+
+
+def _replaceFile(path, data, sync=False):
+    """
+    Atomically replace the file at path with data,
+    keeping the permissions of an existing file.
+    If sync is True, the file and its directory
+    are flushed to disk.
+    """
+    directory = os.path.dirname(path)
+    tempPath = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    try:
+        mode = statModule.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = None
+    fd = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                _fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tempPath, mode)
+        os.replace(tempPath, path)
+        # a descriptor opened ahead refers to the replaced file
+        _closeAdvisedDescriptor(path)
+    except BaseException:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+        raise
+    if sync:
+        _syncDirectory(directory)
+
+
+def _fsync(fd):
+    # fsync doesn't flush the drive's cache on macOS
+    if hasattr(fcntl, "F_FULLFSYNC"):
+        try:
+            fcntl.fcntl(fd, fcntl.F_FULLFSYNC)
+            return
+        except OSError:
+            pass
+    os.fsync(fd)
+
+
+def _syncDirectory(path):
+    # directories can't be opened on Windows and
+    # some file systems don't support syncing them
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        _fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Files replaced since the last sync under the "layer" policy.
+
+_unsyncedPaths = set()
+_unsyncedPathsLock = threading.Lock()
+
+
+def _syncFiles():
+    """
+    Flush the data of the files replaced since
+    the last sync to disk.
+    """
+    with _unsyncedPathsLock:
+        paths = sorted(_unsyncedPaths)
+        _unsyncedPaths.clear()
+    # Windows only flushes files that are open for writing
+    flags = os.O_RDWR if os.name == "nt" else os.O_RDONLY
+    for path in paths:
+        try:
+            fd = os.open(path, flags | getattr(os, "O_BINARY", 0))
+        except FileNotFoundError:
+            # removed since, or moved along with its directory
+            continue
+        try:
+            _fsync(fd)
+        finally:
+            os.close(fd)
 
-    if text != existing:
-        # always use Unix LF end of lines
-        with open(path, "w", encoding="utf-8", newline="\n") as f:
-            f.write(text)
+
+def subpathSyncDirectory(ufoPath, *subpath):
+    """
+    Flush the files replaced since the previous sync
+    and then the entries of a directory to disk if the
+    DURABILITY policy is "layer". A directory sync alone
+    doesn't persist the data of the files, which may
+    come back empty after a crash on file systems that
+    don't write the data before a rename, such as XFS,
+    or on ext4 for files that didn't exist before.
+
+    Files replaced since the previous sync may still be
+    empty after a crash on such file systems. Only the
+    "file" policy syncs each file before it is renamed.
+    """
+    if DURABILITY == "layer":
+        _syncFiles()
+        _syncDirectory(subpathJoin(ufoPath, *subpath) if subpath else ufoPath)
+
+
+def _contentsDiffer(data, path):
+    existing = None
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        existing = FILE_SYSTEM_SNAPSHOT.contents(path)
+        if existing is None:
+            digest = FILE_SYSTEM_SNAPSHOT.digest(path)
+            if digest is not None:
+                return digest != _digest(data)
+    if existing is None:
+        existing = _readFile(path)
+    return existing != data
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
 def subpathWritePlist(data, ufoPath, *subpath):
@@ -1589,18 +3418,17 @@ def subpathWritePlist(data, ufoPath, *subpath):
 
     This will only modify the file if the
     file contains data that is different
-    from the new data.
+    from the new data. The data is compared
+    to the parsed contents of the file, not
+    to its bytes.
     """
-    data = _dumps(data)
-    path = subpathJoin(ufoPath, *subpath)
     if subpathExists(ufoPath, *subpath):
         existing = subpathReadPlist(ufoPath, *subpath)
     else:
         existing = None
 
     if data != existing:
-        with open(path, "wb") as f:
-            f.write(data)
+        subpathWriteBytes(_dumps(data), ufoPath, *subpath)
 
 
 # rename
@@ -1616,6 +3444,12 @@ def subpathRenameFile(ufoPath, fromSubpath, toSubpath):
     inPath = subpathJoin(ufoPath, *fromSubpath)
     outPath = subpathJoin(ufoPath, *toSubpath)
     os.rename(inPath, outPath)
+    with _unsyncedPathsLock:
+        if inPath in _unsyncedPaths:
+            _unsyncedPaths.discard(inPath)
+            _unsyncedPaths.add(outPath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        FILE_SYSTEM_SNAPSHOT.renamed(inPath, outPath)
 
 
 def subpathRenameDirectory(ufoPath, fromSubpath, toSubpath):
@@ -1629,6 +3463,8 @@ def subpathRenameDirectory(ufoPath, fromSubpath, toSubpath):
     inPath = subpathJoin(ufoPath, *fromSubpath)
     outPath = subpathJoin(ufoPath, *toSubpath)
     shutil.move(inPath, outPath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        FILE_SYSTEM_SNAPSHOT.renamed(inPath, outPath)
 
 
 # remove
@@ -1640,6 +3476,8 @@ def subpathRemoveFile(ufoPath, *subpath):
     if subpathExists(ufoPath, *subpath):
         path = subpathJoin(ufoPath, *subpath)
         os.remove(path)
+        if FILE_SYSTEM_SNAPSHOT is not None:
+            FILE_SYSTEM_SNAPSHOT.removed(path)
 
 
 # mod times
@@ -1649,19 +3487,112 @@ def subpathGetModTime(ufoPath, *subpath):
     Get the modification time for a file.
     """
     path = subpathJoin(ufoPath, *subpath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.stat(path).st_mtime
     return os.path.getmtime(path)
 
 
-def subpathNeedsRefresh(modTimes, ufoPath, *subPath):
+def subpathGetSize(ufoPath, *subpath):
+    """
+    Get the size of a file.
+    """
+    path = subpathJoin(ufoPath, *subpath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.stat(path).st_size
+    return os.path.getsize(path)
+
+
+def subpathGetStatSignature(ufoPath, *subpath):
+    """
+    Get a token containing the modification time in
+    nanoseconds and the size of a file.
+    """
+    path = subpathJoin(ufoPath, *subpath)
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.signature(path)
+    return _statSignature(os.stat(path))
+
+
+def subpathScanStatSignatures(ufoPath, *subpath):
+    """
+    Get the stat signatures of all files in a
+    directory from a single directory scan.
+    """
+    path = subpathJoin(ufoPath, *subpath) if subpath else ufoPath
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        return FILE_SYSTEM_SNAPSHOT.signatures(path)
+    signatures = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                signatures[entry.name] = _statSignature(entry.stat())
+    return signatures
+
+
+def _statSignature(stat):
+    # the inode is left out, as copies that keep the modification
+    # time, such as the clone of a staged output, are unchanged
+    return "%d:%d" % (stat.st_mtime_ns, stat.st_size)
+
+
+def subpathGetHash(ufoPath, *subpath):
+    """
+    Get a token containing a digest of a file's contents.
+    """
+    path = subpathJoin(ufoPath, *subpath)
+    digest = None
+    if FILE_SYSTEM_SNAPSHOT is not None:
+        digest = FILE_SYSTEM_SNAPSHOT.digest(path)
+    if digest is None:
+        data = None
+        if FILE_SYSTEM_SNAPSHOT is not None:
+            data = FILE_SYSTEM_SNAPSHOT.contents(path)
+        if data is None:
+            data = _readFile(path)
+        digest = _digest(data)
+        if FILE_SYSTEM_SNAPSHOT is not None:
+            FILE_SYSTEM_SNAPSHOT.storeDigest(path, digest)
+    return hashTokenPrefix + digest
+
+
+def subpathGetChangeToken(ufoPath, *subpath):
+    """
+    Get the token that is compared to detect changes
+    to a file. This is the stat signature or, if
+    CHANGE_DETECTION is "hash", a digest of the contents.
+    """
+    if CHANGE_DETECTION == "hash":
+        return subpathGetHash(ufoPath, *subpath)
+    return subpathGetStatSignature(ufoPath, *subpath)
+
+
+def subpathNeedsRefresh(modTimes, ufoPath, *subPath, signatures=None):
     """
     Determine if a file needs to be refreshed.
-    Returns True if the file's latest modification time is different
-    from its previous modification time.
+    Returns True if the file's latest change token is different
+    from its previous change token. A token stored by a different
+    CHANGE_DETECTION mode never matches. In the mtime mode, float
+    modification times stored by earlier versions are compared
+    to the file's modification time.
+
+    Records may be (kind, token) tuples.
+
+    signatures may map file names to stat signatures
+    that were collected with subpathScanStatSignatures.
     """
     previous = modTimes.get(subPath[-1])
     if previous is None:
         return True
-    latest = subpathGetModTime(ufoPath, *subPath)
+    if isinstance(previous, tuple):
+        _kind, previous = previous
+    latest = None
+    if CHANGE_DETECTION == "mtime":
+        if isinstance(previous, float):
+            latest = subpathGetModTime(ufoPath, *subPath)
+        elif signatures is not None:
+            latest = signatures.get(subPath[-1])
+    if latest is None:
+        latest = subpathGetChangeToken(ufoPath, *subPath)
     return latest != previous
 
 
@@ -1672,12 +3603,31 @@ def subpathNeedsRefresh(modTimes, ufoPath, *subPath):
 def storeModTimes(lib, modTimes):
     """
     Write the file mod times to the lib.
+    Stat signatures and content hash tokens
+    are written as they are.
+
+    If the records are (kind, token) tuples, the current
+    rule versions are written in a "rules:" line and each
+    record is written with its kind.
     """
     lines = [
         "version: %s" % __version__
     ]
+    withKinds = any(isinstance(modTime, tuple) for modTime in modTimes.values())
+    if withKinds:
+        rules = _normalizationRules()
+        lines.append("rules: %s" % " ".join(
+            "%s=%s" % (kind, version) for kind, version in sorted(rules.items())))
     for fileName, modTime in sorted(modTimes.items()):
-        line = "%.1f %s" % (modTime, fileName)
+        kind = None
+        if isinstance(modTime, tuple):
+            kind, modTime = modTime
+        if isinstance(modTime, str):
+            line = "%s %s" % (modTime, fileName)
+        else:
+            line = "%.1f %s" % (modTime, fileName)
+        if withKinds:
+            line = "%s %s" % (kind or "-", line)
         lines.append(line)
     text = "\n".join(lines)
     lib[modTimeLibKey] = text
@@ -1686,30 +3636,200 @@ def storeModTimes(lib, modTimes):
 def readModTimes(lib):
     """
     Read the file mod times from the lib.
+
+    Records stored with rule versions are kept if the rule
+    version of their kind has not changed, regardless of
+    the version of the normalizer that wrote them. Other
+    records are only kept if the version has not changed.
+    Mod times that can't be read are ignored, so that
+    every file is normalized again.
     """
-    # TO DO: a version mismatch causing a complete
-    # renomalization of existing files sucks. but,
-    # I haven't been able to come up with a better
-    # solution. maybe we could keep track of what
-    # would need new normalization from version to
-    # version and only trigger it as needed. most
-    # new versions aren't going to require a complete
-    # rerun of everything.
     text = lib.get(modTimeLibKey)
-    if not text:
+    if not text or not isinstance(text, str):
         return {}
-    lines = text.splitlines()
+    try:
+        return _readModTimeLines(text.splitlines())
+    except ValueError:
+        log.debug("Ignoring mod times in an unknown format.")
+        return {}
+
+
+def _readModTimeLines(lines):
     version = lines.pop(0).split(":")[-1].strip()
+    if lines and lines[0].startswith("rules:"):
+        storedRules = dict(
+            rule.split("=", 1) for rule in lines.pop(0).split(":", 1)[-1].split()
+        )
+        rules = _normalizationRules()
+        modTimes = {}
+        for line in lines:
+            kind, modTime, fileName = line.split(" ", 2)
+            if kind not in rules or storedRules.get(kind) != rules[kind]:
+                continue
+            modTimes[fileName] = (kind, _readModTimeToken(modTime))
+        return modTimes
     if version != __version__:
         return {}
     modTimes = {}
     for line in lines:
         modTime, fileName = line.split(" ", 1)
-        modTime = float(modTime)
-        modTimes[fileName] = modTime
+        modTimes[fileName] = _readModTimeToken(modTime)
     return modTimes
 
 
+def _readModTimeToken(modTime):
+    try:
+        return float(modTime)
+    except ValueError:
+        # stat signature or content hash
+        return modTime
+
+
+def _normalizationRules():
+    """
+    Get the rule versions of the file kinds as strings.
+    The float precision applies to every kind, so it
+    is folded into each version.
+    """
+    if FLOAT_FORMAT is None:
+        precision = "repr"
+    else:
+        precision = FLOAT_FORMAT[2:-1]
+    return {
+        kind: "%d.%s" % (version, precision)
+        for kind, version in normalizationRuleVersions.items()
+    }
+
+
+# ----------
+# State File
+# ----------
+
+# The state file holds the same lib entries that are
+# otherwise written to lib.plist ("lib") and to the lib
+# in each layerinfo.plist ("layers", keyed by layer
+# directory). It is stored as JSON in a state directory
+# under a name derived from the absolute path of the UFO.
+
+stateFileFormatVersion = 1
+
+
+def stateFilePath(stateDirectory, ufoPath):
+    """
+    Get the path of the state file for a UFO.
+    """
+    ufoPath = os.path.abspath(ufoPath)
+    digest = hashlib.blake2b(ufoPath.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(stateDirectory, digest + ".json")
+
+
+def readStateFile(stateDirectory, ufoPath):
+    """
+    Read the state file for a UFO. An empty state is
+    returned if the file doesn't exist or can't be used.
+    """
+    path = stateFilePath(stateDirectory, ufoPath)
+    state = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except ValueError:
+            log.debug('Ignoring invalid state file "%s".', path)
+    if not isinstance(state, dict) or state.get("formatVersion") != stateFileFormatVersion:
+        state = {}
+    return dict(
+        formatVersion=stateFileFormatVersion,
+        ufo=os.path.abspath(ufoPath),
+        fingerprint=state.get("fingerprint"),
+        lib=state.get("lib", {}),
+        layers=state.get("layers", {})
+    )
+
+
+def glyphMappingFilePath(stateDirectory, ufoPath, layerDirectory):
+    """
+    Get the path of the file that holds the glyph
+    mapping of a layer, next to the state file.
+    """
+    path = stateFilePath(stateDirectory, ufoPath)
+    digest = hashlib.blake2b(layerDirectory.encode("utf-8"), digest_size=8).hexdigest()
+    return "%s.%s.json" % (os.path.splitext(path)[0], digest)
+
+
+def readGlyphMappingFile(path, contentsRecord):
+    """
+    Read the glyph mapping kept for a layer. None is
+    returned if there is none or if it doesn't belong
+    to the contents.plist record in the mod times.
+    """
+    if not isinstance(contentsRecord, tuple) or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except ValueError:
+        log.debug('Ignoring invalid glyph mapping file "%s".', path)
+        return None
+    if not isinstance(data, dict) or data.get("contents") != contentsRecord[1]:
+        return None
+    return data.get("glyphMapping")
+
+
+def writeGlyphMappingFile(path, contentsRecord, glyphMapping):
+    """
+    Write the glyph mapping of a layer along with the
+    digest of contents.plist from its mod time record.
+    """
+    if not isinstance(contentsRecord, tuple):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = dict(contents=contentsRecord[1], glyphMapping=glyphMapping)
+    text = json.dumps(data, separators=(",", ":"), sort_keys=True)
+    _replaceFile(path, text.encode("utf-8"), sync=DURABILITY != "none")
+
+
+def layerFingerprint(ufoPath, layerDirectory):
+    """
+    Get a digest of the stat signatures of the files
+    in a layer directory and the normalization rules.
+    """
+    signatures = subpathScanStatSignatures(ufoPath, layerDirectory)
+    return _fingerprint(signatures)
+
+
+def ufoFingerprint(ufoPath):
+    """
+    Get a digest of the stat signatures of the files at the
+    top level of a UFO and in its top level directories, other
+    than the data directory, and the normalization rules.
+    """
+    signatures = subpathScanStatSignatures(ufoPath)
+    for name, isDirectory in subpathListDirectory(ufoPath).items():
+        if isDirectory and name != "data":
+            signatures[name + "/"] = layerFingerprint(ufoPath, name)
+    return _fingerprint(signatures)
+
+
+def _fingerprint(signatures):
+    rules = _normalizationRules()
+    lines = ["%s=%s" % (kind, version) for kind, version in sorted(rules.items())]
+    lines.append(CHANGE_DETECTION)
+    lines.extend("%s %s" % (signature, name) for name, signature in sorted(signatures.items()))
+    text = "\n".join(lines)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def writeStateFile(state, stateDirectory, ufoPath):
+    """
+    Write the state file for a UFO.
+    """
+    os.makedirs(stateDirectory, exist_ok=True)
+    path = stateFilePath(stateDirectory, ufoPath)
+    text = json.dumps(state, separators=(",", ":"), sort_keys=True)
+    _replaceFile(path, text.encode("utf-8"), sync=DURABILITY != "none")
+
+
 # ----------------
 # Image Management
 # ----------------
@@ -1718,8 +3838,10 @@ def readImagesDirectory(ufoPath):
     """
     Get a listing of all images in the images directory.
     """
-    pattern = subpathJoin(ufoPath, *["images", "*.png"])
-    imageNames = [subpathSplit(path)[-1] for path in glob.glob(pattern)]
+    imageNames = [
+        fileName for fileName in subpathListDirectory(ufoPath, "images")
+        if fnmatch.fnmatch(fileName, "*.png") and not fileName.startswith(".")
+    ]
     return set(imageNames)
 
 
@@ -1731,6 +3853,8 @@ def purgeImagesDirectory(ufoPath, toPurge):
         if subpathExists(ufoPath, *["images", fileName]):
             path = subpathJoin(ufoPath, *["images", fileName])
             os.remove(path)
+            if FILE_SYSTEM_SNAPSHOT is not None:
+                FILE_SYSTEM_SNAPSHOT.removed(path)
 
 
 def storeImageReferences(lib, imageReferences):
@@ -1760,6 +3884,49 @@ illegalCharacters += [chr(0x7F)]
 reservedFileNames = "CON PRN AUX CLOCK$ NUL A:-Z: COM1".lower().split(" ")
 reservedFileNames += "LPT1 LPT2 LPT3 COM2 COM3 COM4".lower().split(" ")
 maxFileNameLength = 255
+_reservedFileNames = frozenset(reservedFileNames)
+
+
+class _FileNameCharacterTable(dict):
+
+    """
+    A str.translate table of the file name replacement
+    of each character. Characters that are not in the
+    table are added the first time they are looked up.
+    """
+
+    def __missing__(self, code):
+        character = chr(code)
+        if character in illegalCharacters:
+            replacement = "_"
+        elif character != character.lower():
+            replacement = character + "_"
+        else:
+            replacement = character
+        self[code] = replacement
+        return replacement
+
+
+_fileNameCharacters = _FileNameCharacterTable()
+for _code in range(128):
+    _fileNameCharacters[_code]
+del _code
+
+
+class FileNameIndex(set):
+
+    """
+    A case-insensitive set of existing file names for
+    userNameToFileName that also remembers where the search
+    for a free clash counter ended for each name, so that
+    resolving a clash doesn't count from 1 every time. The
+    names are the same as with a list or set. Names must only
+    be added, as a removed name would not be found again.
+    """
+
+    def __init__(self, names=()):
+        super(FileNameIndex, self).__init__(names)
+        self.clashCounters = {}
 
 
 class NameTranslationError(Exception):
@@ -1775,40 +3942,66 @@ def userNameToFileName(userName, existing=None, prefix="", suffix=""):
         existing = []
     # the incoming name must be a string
     assert isinstance(userName, str), "The value for userName must be a string."
-    # establish the prefix and suffix lengths
-    prefixLength = len(prefix)
-    suffixLength = len(suffix)
+    userName = _filterUserName(userName, prefix, suffix)
+    # test for clash
+    fullName = prefix + userName + suffix
+    if fullName.lower() in existing:
+        fullName = handleClash1(userName, existing, prefix, suffix)
+    # finished
+    return fullName
+
+
+def userNamesToFileNames(userNames, existing=None, prefix="", suffix=""):
+    """
+    Translate a sequence of user names to a list of file
+    names. The result is the same as calling userNameToFileName
+    for each user name in turn and adding each file name to
+    existing. If existing is a FileNameIndex, the file names
+    are added to it. Otherwise it is copied into a new one.
+    """
+    if not isinstance(existing, FileNameIndex):
+        existing = FileNameIndex(existing or ())
+    fileNames = []
+    for userName in userNames:
+        # the incoming name must be a string
+        assert isinstance(userName, str), "The value for userName must be a string."
+        userName = _filterUserName(userName, prefix, suffix)
+        fullName = prefix + userName + suffix
+        lowerName = fullName.lower()
+        if lowerName in existing:
+            fullName = handleClash1(userName, existing, prefix, suffix)
+            lowerName = fullName.lower()
+        existing.add(lowerName)
+        fileNames.append(fullName)
+    return fileNames
+
+
+def _filterUserName(userName, prefix, suffix):
+    """
+    Apply the character, length and reserved name
+    rules of the user name to file name convention.
+    """
     # replace an initial period with an _
     # if no prefix is to be added
     if not prefix and userName[0] == ".":
         userName = "_" + userName[1:]
-    # filter the user name
-    filteredUserName = []
-    for character in userName:
-        # replace illegal characters with _
-        if character in illegalCharacters:
-            character = "_"
-        # add _ to all non-lower characters
-        elif character != character.lower():
-            character += "_"
-        filteredUserName.append(character)
-    userName = "".join(filteredUserName)
+    # replace illegal characters with _ and
+    # add _ to all non-lower characters
+    userName = userName.translate(_fileNameCharacters)
     # clip to 255
-    sliceLength = maxFileNameLength - prefixLength - suffixLength
+    sliceLength = maxFileNameLength - len(prefix) - len(suffix)
     userName = userName[:sliceLength]
     # test for illegal files names
-    parts = []
-    for part in userName.split("."):
-        if part.lower() in reservedFileNames:
-            part = "_" + part
-        parts.append(part)
-    userName = ".".join(parts)
-    # test for clash
-    fullName = prefix + userName + suffix
-    if fullName.lower() in existing:
-        fullName = handleClash1(userName, existing, prefix, suffix)
-    # finished
-    return fullName
+    if "." in userName:
+        parts = []
+        for part in userName.split("."):
+            if part.lower() in _reservedFileNames:
+                part = "_" + part
+            parts.append(part)
+        userName = ".".join(parts)
+    elif userName.lower() in _reservedFileNames:
+        userName = "_" + userName
+    return userName
 
 
 def handleClash1(userName, existing=None, prefix="", suffix=""):
@@ -1827,8 +4020,11 @@ def handleClash1(userName, existing=None, prefix="", suffix=""):
         sliceLength = maxFileNameLength - length
         userName = userName[:sliceLength]
     finalName = None
-    # try to add numbers to create a unique name
-    counter = 1
+    # try to add numbers to create a unique name,
+    # starting where a previous search left off
+    counters = getattr(existing, "clashCounters", None)
+    key = ("1", (prefix + userName).lower(), suffix.lower())
+    counter = 1 if counters is None else counters.get(key, 1)
     while finalName is None:
         name = userName + str(counter).zfill(15)
         fullName = prefix + name + suffix
@@ -1839,6 +4035,8 @@ def handleClash1(userName, existing=None, prefix="", suffix=""):
             counter += 1
         if counter >= 999999999999999:
             break
+    if counters is not None:
+        counters[key] = counter
     # if there is a clash, go to the next fallback
     if finalName is None:
         finalName = handleClash2(existing, prefix, suffix)
@@ -1856,9 +4054,12 @@ def handleClash2(existing=None, prefix="", suffix=""):
     # calculate the longest possible string
     maxLength = maxFileNameLength - len(prefix) - len(suffix)
     maxValue = int("9" * maxLength)
-    # try to find a number
+    # try to find a number, starting where
+    # a previous search left off
+    counters = getattr(existing, "clashCounters", None)
+    key = ("2", prefix.lower(), suffix.lower())
     finalName = None
-    counter = 1
+    counter = 1 if counters is None else counters.get(key, 1)
     while finalName is None:
         fullName = prefix + str(counter) + suffix
         if fullName.lower() not in existing:
@@ -1868,6 +4069,8 @@ def handleClash2(existing=None, prefix="", suffix=""):
             counter += 1
         if counter >= maxValue:
             break
+    if counters is not None:
+        counters[key] = counter
     # raise an error if nothing has been found
     if finalName is None:
         raise NameTranslationError("No unique name could be found.")
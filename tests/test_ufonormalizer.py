@@ -2,17 +2,23 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import subprocess
+import multiprocessing
 import unittest
 import tempfile
 import shutil
 import datetime
+import errno
 from io import open
 from xml.etree import cElementTree as ET
+import ufonormalizer
 from ufonormalizer import (
     normalizeGLIF, normalizeGlyphsDirectoryNames, normalizeGlyphNames,
     subpathJoin, subpathSplit, subpathExists, subpathReadFile,
     subpathReadPlist, subpathWriteFile, subpathWritePlist, subpathRenameFile,
     subpathRemoveFile, subpathGetModTime, subpathNeedsRefresh, modTimeLibKey,
+    subpathGetStatSignature, subpathScanStatSignatures, subpathListDirectory,
+    subpathRenameDirectory, _fileSystemSnapshot, subpathWriteBytes, subpathGetHash,
     storeModTimes, readModTimes, UFONormalizerError, XMLWriter, tobytes,
     userNameToFileName, handleClash1, handleClash2, xmlEscapeText,
     xmlEscapeAttribute, xmlConvertValue, xmlConvertFloat, xmlConvertInt,
@@ -26,12 +32,19 @@ from ufonormalizer import (
     _normalizeGlifPointAttributesFormat2,
     _normalizeGlifComponentAttributesFormat2, _normalizeGlifTransformation,
     _normalizeColorString, _convertPlistElementToObject, _normalizePlistFile,
-    main, xmlDeclaration, plistDocType, _decode_base64)
+    _writeNormalizedPlist,
+    main, xmlDeclaration, plistDocType, _decode_base64, normalizeUFO,
+    normalizeGLIFString, _loads, lxmlET, normalizeGLIFBytes, DURABILITY_POLICIES,
+    normalizeGLIFFiles, subpathReadBytes, subpathAdviseWillNeed, _readAheadOrder, renamePlan,
+    renamePlanReport, _foldGlyphNames, FileNameIndex, userNamesToFileNames, xmlConvertNumberString,
+    numberMemoStatistics)
 from ufonormalizer import __version__ as ufonormalizerVersion
 
-from plistlib import loads, dumps
+from plistlib import loads, dumps, FMT_BINARY
+from xml.parsers.expat import ExpatError
 from io import StringIO
 from tempfile import TemporaryDirectory
+from concurrent.futures import ThreadPoolExecutor
 
 GLIFFORMAT1 = '''\
 <?xml version="1.0" encoding="UTF-8"?>
@@ -165,6 +178,74 @@ METAINFO_PLIST = "\n".join([xmlDeclaration, plistDocType, """\
 """])
 
 
+def makeTestUFO(path, glyphNames=("period",), layerNames=("public.default",)):
+    """
+    Write a UFO 3 containing unnormalized GLIF
+    files for each glyph name in each layer.
+    """
+    os.mkdir(path)
+    with open(os.path.join(path, "metainfo.plist"), "w") as f:
+        f.write(METAINFO_PLIST % 3)
+    layerContents = []
+    for layerName in layerNames:
+        if layerName == "public.default":
+            layerDirectory = "glyphs"
+        else:
+            layerDirectory = "glyphs." + layerName
+        layerContents.append([layerName, layerDirectory])
+        os.mkdir(os.path.join(path, layerDirectory))
+        contents = {}
+        for index, glyphName in enumerate(glyphNames):
+            fileName = glyphName + ".glif"
+            contents[glyphName] = fileName
+            glif = GLIFFORMAT2.replace('name="period"', 'name="%s"' % glyphName)
+            # vary the file sizes
+            points = '<point x="%d.50" y="0.0" type="line"/>' % index
+            glif = glif.replace("<contour>", "<contour>" + points * (index % 7), 1)
+            with open(os.path.join(path, layerDirectory, fileName), "w") as f:
+                f.write(glif)
+        with open(os.path.join(path, layerDirectory, "contents.plist"), "wb") as f:
+            f.write(dumps(contents))
+    with open(os.path.join(path, "layercontents.plist"), "wb") as f:
+        f.write(dumps(layerContents))
+    with open(os.path.join(path, "fontinfo.plist"), "w") as f:
+        f.write(INFOPLIST_GUIDELINES)
+    groups = {"public.kern1.%s" % glyphName: [glyphName] for glyphName in glyphNames}
+    with open(os.path.join(path, "groups.plist"), "wb") as f:
+        f.write(dumps(groups))
+    kerning = {first: {second: -10.0 for second in glyphNames} for first in glyphNames}
+    with open(os.path.join(path, "kerning.plist"), "wb") as f:
+        f.write(dumps(kerning))
+    os.mkdir(os.path.join(path, "images"))
+    for fileName in ("period sketch.png", "unused.png"):
+        with open(os.path.join(path, "images", fileName), "wb") as f:
+            f.write(b"\x89PNG")
+
+
+def workerState(settings):
+    """
+    Get the run time state of a worker process.
+    """
+    ufonormalizer._applyWorkerSettings(settings)
+    return (ufonormalizer.FILE_SYSTEM_SNAPSHOT is None,
+            sorted(ufonormalizer._unsyncedPaths),
+            sorted(ufonormalizer._advisedDescriptors))
+
+
+def readTree(path):
+    """
+    Read all files below path into a dict
+    mapping relative paths to bytes.
+    """
+    tree = {}
+    for directory, _, fileNames in os.walk(path):
+        for fileName in fileNames:
+            filePath = os.path.join(directory, fileName)
+            with open(filePath, "rb") as f:
+                tree[os.path.relpath(filePath, path)] = f.read()
+    return tree
+
+
 class redirect_stderr(object):
     """ Context manager for temporarily redirecting stderr to another file.
     Adapted from CPython 3.5 'contextlib._RedirectStream' source:
@@ -1583,6 +1664,611 @@ class UFONormalizerTest(unittest.TestCase):
                 """))
 
 
+class NormalizeUFOTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_normalizeUFO_workers(self):
+        glyphNames = ["glyph%d" % i for i in range(40)]
+        serialPath = os.path.join(self.directory, "serial.ufo")
+        parallelPath = os.path.join(self.directory, "parallel.ufo")
+        makeTestUFO(serialPath, glyphNames, ("public.default", "sketches"))
+        makeTestUFO(parallelPath, glyphNames, ("public.default", "sketches"))
+        normalizeUFO(serialPath, writeModTimes=False)
+        normalizeUFO(parallelPath, writeModTimes=False, workers=2)
+        serial = readTree(serialPath)
+        self.assertEqual(serial, readTree(parallelPath))
+        self.assertNotIn(os.path.join("images", "unused.png"), serial)
+        self.assertIn(os.path.join("images", "period sketch.png"), serial)
+
+    @unittest.skipIf(multiprocessing.get_start_method() != "fork",
+                     "workers are not forked on this platform")
+    def test_normalizeUFO_workers_unguarded_script(self):
+        path = os.path.join(self.directory, "test.ufo")
+        makeTestUFO(path, ["glyph%d" % i for i in range(40)])
+        script = os.path.join(self.directory, "script.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write("from ufonormalizer import normalizeUFO\n"
+                    "normalizeUFO(%r, workers=2)\n" % path)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [os.path.dirname(ufonormalizer.__file__), env.get("PYTHONPATH", "")])
+        subprocess.check_call([sys.executable, script], env=env)
+
+    def test_processPool_worker_state(self):
+        path = os.path.join(self.directory, "a")
+        with ufonormalizer._fileSystemSnapshot() as snapshot:
+            ufonormalizer._unsyncedPaths.add(path)
+            try:
+                with ufonormalizer._processPool(2) as pool:
+                    state = pool.submit(workerState, ufonormalizer._workerSettings()).result()
+                self.assertEqual(state, (True, [], []))
+                # the parent keeps its own state
+                workerState(ufonormalizer._workerSettings())
+                self.assertIs(ufonormalizer.FILE_SYSTEM_SNAPSHOT, snapshot)
+                self.assertEqual(ufonormalizer._unsyncedPaths, {path})
+            finally:
+                ufonormalizer._unsyncedPaths.discard(path)
+
+    def test_normalizeUFO_workers_concurrent_units(self):
+        glyphNames = ["glyph%d" % i for i in range(20)]
+        layerNames = ["public.default"] + ["layer%d" % i for i in range(5)]
+        serialPath = os.path.join(self.directory, "serial.ufo")
+        parallelPath = os.path.join(self.directory, "parallel.ufo")
+        makeTestUFO(serialPath, glyphNames, layerNames)
+        makeTestUFO(parallelPath, glyphNames, layerNames)
+        normalizeUFO(serialPath)
+        normalizeUFO(parallelPath, workers=3)
+        serial = readTree(serialPath)
+        parallel = readTree(parallelPath)
+        self.assertEqual(sorted(serial), sorted(parallel))
+        for fileName in ("fontinfo.plist", "groups.plist", "kerning.plist",
+                         "layercontents.plist", "metainfo.plist"):
+            self.assertEqual(serial[fileName], parallel[fileName])
+        for layerName in layerNames[1:]:
+            fileName = os.path.join("glyphs." + layerName, "glyph3.glif")
+            self.assertEqual(serial[fileName], parallel[fileName])
+        self.assertEqual(
+            sorted(readModTimes(subpathReadPlist(serialPath, "lib.plist"))),
+            sorted(readModTimes(subpathReadPlist(parallelPath, "lib.plist"))))
+
+    def test_normalizeUFO_ioThreads(self):
+        glyphNames = ["glyph%d" % i for i in range(100)]
+        serialPath = os.path.join(self.directory, "serial.ufo")
+        overlappedPath = os.path.join(self.directory, "overlapped.ufo")
+        makeTestUFO(serialPath, glyphNames, ("public.default", "sketches"))
+        makeTestUFO(overlappedPath, glyphNames, ("public.default", "sketches"))
+        normalizeUFO(serialPath)
+        normalizeUFO(overlappedPath, ioThreads=3)
+        serial = readTree(serialPath)
+        overlapped = readTree(overlappedPath)
+        self.assertEqual(sorted(serial), sorted(overlapped))
+        for fileName, data in serial.items():
+            if fileName.endswith(".glif"):
+                self.assertEqual(data, overlapped[fileName])
+        self.assertEqual(
+            sorted(readModTimes(subpathReadPlist(serialPath, "lib.plist"))),
+            sorted(readModTimes(subpathReadPlist(overlappedPath, "lib.plist"))))
+        # errors surface after the pending writes finished
+        subpathRemoveFile(overlappedPath, "glyphs", "glyph50.glif")
+        with ThreadPoolExecutor(max_workers=2) as ioPool:
+            with self.assertRaises(FileNotFoundError):
+                normalizeGLIFFiles(overlappedPath, "glyphs",
+                                   ["glyph%d.glif" % i for i in range(60)], ioPool=ioPool)
+
+    def test_normalizeUFO_outputPath(self):
+        inputPath = os.path.join(self.directory, "input.ufo")
+        makeTestUFO(inputPath, ["a", "b"], ("public.default", "sketches"))
+        os.mkdir(os.path.join(inputPath, "data"))
+        subpathWriteBytes(b"foo", inputPath, "data", "foo.txt")
+        original = readTree(inputPath)
+        copiedPath = os.path.join(self.directory, "copied.ufo")
+        linkedPath = os.path.join(self.directory, "linked.ufo")
+        normalizeUFO(inputPath, outputPath=copiedPath, writeModTimes=False)
+        normalizeUFO(inputPath, outputPath=linkedPath, writeModTimes=False, hardlinkOutput=True)
+        self.assertEqual(readTree(inputPath), original)
+        self.assertEqual(readTree(copiedPath), readTree(linkedPath))
+        self.assertNotEqual(readTree(copiedPath), original)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["copied.ufo", "input.ufo", "linked.ufo"])
+        inputStat = os.stat(os.path.join(inputPath, "data", "foo.txt"))
+        self.assertTrue(os.path.samestat(inputStat, os.stat(os.path.join(linkedPath, "data", "foo.txt"))))
+        self.assertFalse(os.path.samestat(inputStat, os.stat(os.path.join(copiedPath, "data", "foo.txt"))))
+        # a failed run leaves the existing output untouched
+        subpathRemoveFile(inputPath, "metainfo.plist")
+        with self.assertRaises(UFONormalizerError):
+            normalizeUFO(inputPath, outputPath=copiedPath, writeModTimes=False)
+        self.assertEqual(readTree(copiedPath), readTree(linkedPath))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["copied.ufo", "input.ufo", "linked.ufo"])
+
+    @unittest.skipIf(not hasattr(os, "copy_file_range"), "copy_file_range is not available")
+    def test_cloneUFO_copy_file_range(self):
+        inputPath = os.path.join(self.directory, "input.ufo")
+        makeTestUFO(inputPath, ["a", "b"], ("public.default", "sketches"))
+        ufonormalizer.cloneUFO(inputPath, os.path.join(self.directory, "copied.ufo"))
+        copyFileRange = os.copy_file_range
+
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        os.copy_file_range = unsupported
+        try:
+            ufonormalizer.cloneUFO(inputPath, os.path.join(self.directory, "fallback.ufo"))
+        finally:
+            os.copy_file_range = copyFileRange
+        original = readTree(inputPath)
+        self.assertEqual(readTree(os.path.join(self.directory, "copied.ufo")), original)
+        self.assertEqual(readTree(os.path.join(self.directory, "fallback.ufo")), original)
+
+    def test_normalizeUFO_outputPath_unchanged(self):
+        # the clone keeps the modification times and sizes of the
+        # input, so files that were normalized before are skipped
+        normalized = []
+        normalizeGLIFFunction = ufonormalizer.normalizeGLIF
+
+        def countingNormalizeGLIF(ufoPath, *subpath, **kwargs):
+            normalized.append(subpath)
+            return normalizeGLIFFunction(ufoPath, *subpath, **kwargs)
+
+        libPath = os.path.join(self.directory, "lib.ufo")
+        statePath = os.path.join(self.directory, "state.ufo")
+        stateDirectory = os.path.join(self.directory, "state")
+        makeTestUFO(libPath, ["a", "b"], ("public.default", "sketches"))
+        makeTestUFO(statePath, ["a", "b"], ("public.default", "sketches"))
+        normalizeUFO(libPath)
+        normalizeUFO(statePath, writeModTimes=False)
+        ufonormalizer.normalizeGLIF = countingNormalizeGLIF
+        try:
+            counts = []
+            for _run in range(2):
+                normalizeUFO(libPath, outputPath=os.path.join(self.directory, "lib-output.ufo"))
+                normalizeUFO(statePath, outputPath=os.path.join(self.directory, "state-output.ufo"),
+                             stateDirectory=stateDirectory)
+                counts.append(len(normalized))
+                del normalized[:]
+        finally:
+            ufonormalizer.normalizeGLIF = normalizeGLIFFunction
+        # the state records the output on the first run
+        self.assertEqual(counts, [4, 0])
+
+    def test_normalizeUFO_durability(self):
+        glyphNames = ["glyph%d" % i for i in range(10)]
+        expected = None
+        for durability in DURABILITY_POLICIES:
+            path = os.path.join(self.directory, durability + ".ufo")
+            makeTestUFO(path, glyphNames, ("public.default", "sketches"))
+            normalizeUFO(path, writeModTimes=False, durability=durability)
+            tree = readTree(path)
+            self.assertFalse([fileName for fileName in tree if fileName.endswith(".tmp")])
+            if expected is None:
+                expected = tree
+            self.assertEqual(tree, expected)
+        with self.assertRaisesRegex(UFONormalizerError, "Unknown durability policy"):
+            normalizeUFO(path, durability="never")
+
+    def test_normalizeUFO_durability_layer_files(self):
+        path = os.path.join(self.directory, "test.ufo")
+        makeTestUFO(path, ["glyph%d" % i for i in range(10)], ("public.default", "sketches"))
+        synced = set()
+        fsync = ufonormalizer._fsync
+
+        def recordingFsync(fd):
+            synced.add(os.fstat(fd).st_ino)
+            fsync(fd)
+
+        ufonormalizer._fsync = recordingFsync
+        try:
+            normalizeUFO(path, writeModTimes=False, durability="layer")
+        finally:
+            ufonormalizer._fsync = fsync
+        for directory in ("glyphs", "glyphs.sketches"):
+            for fileName in os.listdir(os.path.join(path, directory)):
+                self.assertIn(os.stat(os.path.join(path, directory, fileName)).st_ino, synced)
+            self.assertIn(os.stat(os.path.join(path, directory)).st_ino, synced)
+        self.assertFalse(ufonormalizer._unsyncedPaths)
+
+    def test_normalizeUFO_all_skips_refresh_checks(self):
+        # --all normalizes every GLIF file without checking
+        # the mod times or scanning the glyphs directories
+        checked = []
+        needsRefresh = ufonormalizer.subpathNeedsRefresh
+        scan = ufonormalizer.subpathScanStatSignatures
+
+        def recording(function):
+            def wrapper(*args, **kwargs):
+                if any(str(arg).startswith("glyphs") for arg in args[1:]):
+                    checked.append(args)
+                return function(*args, **kwargs)
+            return wrapper
+
+        for formatVersion in (2, 3):
+            path = os.path.join(self.directory, "%d.ufo" % formatVersion)
+            makeTestUFO(path, ["glyph%d" % i for i in range(10)])
+            if formatVersion == 2:
+                os.remove(os.path.join(path, "layercontents.plist"))
+                subpathWriteFile(METAINFO_PLIST % 2, path, "metainfo.plist")
+            normalizeUFO(path)
+            ufonormalizer.subpathNeedsRefresh = recording(needsRefresh)
+            ufonormalizer.subpathScanStatSignatures = recording(scan)
+            try:
+                normalizeUFO(path, onlyModified=False)
+            finally:
+                ufonormalizer.subpathNeedsRefresh = needsRefresh
+                ufonormalizer.subpathScanStatSignatures = scan
+            self.assertEqual(checked, [])
+            normalizeUFO(path)
+            ufonormalizer.subpathNeedsRefresh = recording(needsRefresh)
+            try:
+                normalizeUFO(path)
+            finally:
+                ufonormalizer.subpathNeedsRefresh = needsRefresh
+            self.assertEqual(len(checked), 10)
+            del checked[:]
+
+    def test_normalizeUFO_unchanged_contents(self):
+        glyphNames = ["glyph%d" % i for i in range(10)]
+        libPath = os.path.join(self.directory, "lib.ufo")
+        statePath = os.path.join(self.directory, "state.ufo")
+        stateDirectory = os.path.join(self.directory, "state")
+        makeTestUFO(libPath, glyphNames)
+        makeTestUFO(statePath, glyphNames)
+        translated = []
+        translate = ufonormalizer.userNamesToFileNames
+
+        def countingTranslate(userNames, *args, **kwargs):
+            translated.extend(userNames)
+            return translate(userNames, *args, **kwargs)
+
+        mappingReads = []
+        readGlyphMappingFile = ufonormalizer.readGlyphMappingFile
+
+        def countingReadGlyphMappingFile(*args):
+            mappingReads.append(args)
+            return readGlyphMappingFile(*args)
+
+        ufonormalizer.userNamesToFileNames = countingTranslate
+        ufonormalizer.readGlyphMappingFile = countingReadGlyphMappingFile
+        try:
+            for path, kwargs in ((libPath, {}), (statePath, dict(stateDirectory=stateDirectory))):
+                normalizeUFO(path, **kwargs)
+                del translated[:]
+                normalizeUFO(path, **kwargs)
+                self.assertEqual(translated, [])
+                # the glyph mapping is only read once contents.plist changes
+                self.assertEqual(mappingReads, [])
+                # add a glyph and rename an other one
+                contents = subpathReadPlist(path, "glyphs", "contents.plist")
+                contents["New"] = contents.pop("glyph1")
+                contents["glyph3"] = "other.glif"
+                subpathRenameFile(path, ("glyphs", "glyph1.glif"), ("glyphs", "new.glif"))
+                subpathRenameFile(path, ("glyphs", "glyph3.glif"), ("glyphs", "other.glif"))
+                contents["New"] = "new.glif"
+                subpathWritePlist(contents, path, "glyphs", "contents.plist")
+                normalizeUFO(path, **kwargs)
+                if path == libPath:
+                    self.assertEqual(len(translated), len(glyphNames))
+                else:
+                    self.assertEqual(sorted(translated), ["New", "glyph3"])
+                del translated[:]
+            self.assertEqual(len(mappingReads), 1)
+            with open(ufonormalizer.stateFilePath(stateDirectory, statePath), encoding="utf-8") as f:
+                self.assertNotIn("glyphMapping", f.read())
+        finally:
+            ufonormalizer.userNamesToFileNames = translate
+            ufonormalizer.readGlyphMappingFile = readGlyphMappingFile
+        stateTree = readTree(os.path.join(statePath, "glyphs"))
+        libTree = readTree(os.path.join(libPath, "glyphs"))
+        stateTree.pop("layerinfo.plist", None)
+        libTree.pop("layerinfo.plist", None)
+        self.assertEqual(stateTree, libTree)
+        self.assertEqual(subpathReadPlist(statePath, "glyphs", "contents.plist")["New"], "N_ew.glif")
+
+    def test_normalizeUFO_changeDetection_hash(self):
+        path = os.path.join(self.directory, "test.ufo")
+        makeTestUFO(path, ["a", "b", "c"])
+        normalizeUFO(path, changeDetection="hash")
+        lib = subpathReadPlist(path, "glyphs", "layerinfo.plist")["lib"]
+        modTimes = readModTimes(lib)
+        self.assertEqual(sorted(modTimes), ["a.glif", "b.glif", "c.glif", "contents.plist"])
+        kind, token = modTimes["a.glif"]
+        self.assertEqual(kind, "glif2")
+        self.assertTrue(token.startswith("blake2b:"))
+        # a new modification time alone doesn't trigger a refresh
+        os.utime(os.path.join(path, "glyphs", "a.glif"), (0, 0))
+        glifPath = os.path.join(path, "glyphs", "b.glif")
+        with open(glifPath, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(glifPath, "w", encoding="utf-8") as f:
+            f.write(text.replace("\t", "    "))
+        with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+            normalizeUFO(path, changeDetection="hash")
+        normalized = [line for line in logs.output if ".glif" in line]
+        self.assertEqual(len(normalized), 1)
+        self.assertIn("b.glif", normalized[0])
+        with open(glifPath, "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), text)
+        with self.assertRaisesRegex(UFONormalizerError, "Unknown change detection"):
+            normalizeUFO(path, changeDetection="size")
+
+    def test_normalizeUFO_unchanged_files_are_skipped(self):
+        path = os.path.join(self.directory, "test.ufo")
+        makeTestUFO(path, ["a", "b"])
+        normalizeUFO(path)
+        with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+            normalizeUFO(path)
+        tracked = (".glif", "fontinfo.plist", "groups.plist", "kerning.plist", "metainfo.plist")
+        self.assertEqual([line for line in logs.output if line.endswith(tracked, 0, -2)], [])
+
+    def test_normalizeUFO_stateDirectory(self):
+        path = os.path.join(self.directory, "test.ufo")
+        stateDirectory = os.path.join(self.directory, "state")
+        makeTestUFO(path, ["a", "b"], ("public.default", "sketches"))
+        normalizeUFO(path, writeModTimes=False, stateDirectory=stateDirectory)
+        self.assertFalse(subpathExists(path, "lib.plist"))
+        self.assertFalse(subpathExists(path, "glyphs.sketches", "layerinfo.plist"))
+        # the state file and the glyph mapping of each layer
+        self.assertEqual(len(os.listdir(stateDirectory)), 3)
+        self.assertIn(os.path.join("images", "period sketch.png"), readTree(path))
+        stats = {}
+        for root, _directories, fileNames in os.walk(path):
+            for fileName in fileNames:
+                filePath = os.path.join(root, fileName)
+                stats[filePath] = os.stat(filePath).st_mtime_ns
+        with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+            normalizeUFO(path, writeModTimes=False, stateDirectory=stateDirectory)
+        self.assertEqual([line for line in logs.output if ".glif" in line], [])
+        for filePath, modTime in stats.items():
+            self.assertEqual(os.stat(filePath).st_mtime_ns, modTime, filePath)
+
+    def test_normalizeUFO_stateDirectory_fingerprints(self):
+        path = os.path.join(self.directory, "test.ufo")
+        stateDirectory = os.path.join(self.directory, "state")
+        makeTestUFO(path, ["a", "b"], ("public.default", "sketches"))
+        normalizeUFO(path, stateDirectory=stateDirectory)
+        with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+            normalizeUFO(path, stateDirectory=stateDirectory)
+        self.assertEqual(logs.output, ['DEBUG:ufonormalizer:Using the %s XML backend.'
+                                       % ufonormalizer.XML_BACKEND,
+                                       'DEBUG:ufonormalizer:Skipping unchanged "test.ufo".'])
+        # only the modified layer is processed
+        glifPath = os.path.join(path, "glyphs.sketches", "a.glif")
+        with open(glifPath, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(glifPath, "w", encoding="utf-8") as f:
+            f.write(text.replace("\t", "  "))
+        with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+            normalizeUFO(path, stateDirectory=stateDirectory)
+        self.assertIn('DEBUG:ufonormalizer:Skipping unchanged "glyphs".', logs.output)
+        self.assertIn('DEBUG:ufonormalizer:Normalizing "%s".'
+                      % os.path.join("glyphs.sketches", "a.glif"), logs.output)
+        with open(glifPath, "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), text)
+        # image references of skipped layers are kept
+        self.assertIn(os.path.join("images", "period sketch.png"), readTree(path))
+
+    def test_main_jobs_argument(self):
+        stream = StringIO()
+        with TemporaryDirectory(suffix=".ufo") as tmp:
+            with self.assertRaisesRegex(SystemExit, '2'):
+                with redirect_stderr(stream):
+                    main(['--jobs', '-1', tmp])
+        self.assertTrue("jobs must be >= 0" in stream.getvalue())
+
+
+class GLIFEngineTest(unittest.TestCase):
+
+    edgeCases = [
+        # invalid point invalidates the contour
+        '<glyph name="a" format="2"><outline><contour><point x="1" y="2"/>'
+        '<point x="a" y="1" type="line"/></contour><contour>'
+        '<point x="1" y="1" type="bogus"/></contour></outline></glyph>',
+        # identifier only points, identifiers and escaping
+        '<glyph name="a&amp;b" format="2"><outline><contour identifier="c1">'
+        '<point identifier="p1"/><point x="1.50" y="-0.0" type="curve" '
+        'smooth="yes" name="&lt;n&gt;" identifier="p2"/><foo/></contour>'
+        '<component base="b" xScale="1" xOffset="10.0" identifier="i"/>'
+        '<component/><bar/></outline></glyph>',
+        # smooth on offcurve, last advance/note/lib win, note children
+        '<glyph name="a" format="2"><advance width="10"/><note>first</note>'
+        '<outline><contour><point x="1" y="1" smooth="yes"/></contour>'
+        '</outline><advance width="20" height="0.0"/><outline/>'
+        '<note>\n\tsecond <b>bold</b> tail\n</note>'
+        '<lib><dict><key>x</key><string>y</string></dict></lib>'
+        '<lib><dict><key>public.markColor</key><string>1,0,0,1</string>'
+        '<key>z</key><array><integer>1</integer><real>2.5</real></array>'
+        '</dict></lib><unicode hex="41"/><unicode hex="zz"/></glyph>',
+        # format 1 implied anchors and ignored format 2 elements
+        '<glyph name="a" format="1"><outline><contour>'
+        '<point x="1" y="2" type="move" name="top" identifier="x"/></contour>'
+        '<component base="b" identifier="x"/><contour>'
+        '<point x="1" y="2" type="move"/><point x="3" y="4"/></contour>'
+        '</outline><anchor x="1" y="1"/><image fileName="a.png"/>'
+        '<guideline x="1" y="1" angle="0"/></glyph>',
+        # format 2 anchors, guidelines and images
+        '<glyph name="a" format="2"><image fileName="b.png" xScale="0.5" '
+        'color="1,0,0,.5"/><anchor x="1" y="1" name="top" color="1,0,0,1"/>'
+        '<anchor x="" y="1"/><guideline x="1" angle="0"/>'
+        '<guideline y="10" identifier="g"/><note/></glyph>',
+    ]
+
+    def assertEnginesEqual(self, text):
+        treeImages = []
+        expatImages = []
+        expected = normalizeGLIFString(text, None, treeImages, engine="tree")
+        result = normalizeGLIFString(text, None, expatImages, engine="expat")
+        self.assertEqual(expected, result)
+        self.assertEqual(treeImages, expatImages)
+
+    def test_normalizeGLIFString_engines_formats_1_and_2(self):
+        self.maxDiff = None
+        for text in (GLIFFORMAT1, GLIFFORMAT2):
+            self.assertEnginesEqual(text)
+
+    def test_normalizeGLIFString_engines_edge_cases(self):
+        self.maxDiff = None
+        for text in self.edgeCases:
+            self.assertEnginesEqual(text)
+
+    def test_normalizeGLIFString_expat_image_reference(self):
+        imageFileRef = []
+        normalizeGLIFString(self.edgeCases[-1], None, imageFileRef, engine="expat")
+        self.assertEqual(imageFileRef, ["b.png"])
+
+    def test_normalizeGLIFString_image_reference(self):
+        # the whole file name is referenced, not its first character
+        for engine in ("tree", "expat"):
+            imageFileRef = []
+            normalizeGLIFString(GLIFFORMAT2, None, imageFileRef, engine=engine)
+            self.assertEqual(imageFileRef, ["period sketch.png"])
+
+    def test_normalizeGLIFString_expat_errors(self):
+        with self.assertRaises(ET.ParseError):
+            normalizeGLIFString('<glyph name="a" format="2">', engine="expat")
+        with self.assertRaisesRegex(UFONormalizerError, "Undefined GLIF format: a.glif"):
+            normalizeGLIFString('<glyph name="a"/>', "a.glif", engine="expat")
+        with self.assertRaisesRegex(UFONormalizerError, "Unknown GLIF engine"):
+            normalizeGLIFString('<glyph name="a" format="2"/>', engine="sax")
+
+    def test_normalizeGLIFBytes(self):
+        for engine in ("tree", "expat"):
+            for text in (GLIFFORMAT1, GLIFFORMAT2) + tuple(self.edgeCases):
+                textImages = []
+                bytesImages = []
+                expected = normalizeGLIFString(text, None, textImages, engine=engine)
+                result = normalizeGLIFBytes(text.encode("utf-8"), None, bytesImages, engine=engine)
+                self.assertIsInstance(result, bytes)
+                self.assertEqual(result, expected.encode("utf-8"))
+                self.assertEqual(bytesImages, textImages)
+        # non-ASCII names are parsed from the raw bytes
+        data = '<glyph name="é" format="2"/>'.encode("utf-8")
+        self.assertIn('name="é"'.encode("utf-8"), normalizeGLIFBytes(data))
+
+    def test_normalizeGLIF_unchanged_is_not_written(self):
+        with TemporaryDirectory() as tmp:
+            normalized = normalizeGLIFString(GLIFFORMAT2).encode("utf-8")
+            path = os.path.join(tmp, "a.glif")
+            with open(path, "wb") as f:
+                f.write(normalized)
+            os.utime(path, ns=(0, 0))
+            normalizeGLIF(tmp, "a.glif")
+            self.assertEqual(os.stat(path).st_mtime_ns, 0)
+
+    def test_normalizeUFO_glifEngine(self):
+        with TemporaryDirectory() as tmp:
+            treePath = os.path.join(tmp, "tree.ufo")
+            expatPath = os.path.join(tmp, "expat.ufo")
+            makeTestUFO(treePath, ["glyph%d" % i for i in range(5)])
+            makeTestUFO(expatPath, ["glyph%d" % i for i in range(5)])
+            normalizeUFO(treePath, writeModTimes=False)
+            normalizeUFO(expatPath, writeModTimes=False, glifEngine="expat")
+            self.assertEqual(readTree(treePath), readTree(expatPath))
+
+    def test_main_glif_engine_argument(self):
+        stream = StringIO()
+        with TemporaryDirectory(suffix=".ufo") as tmp:
+            with self.assertRaisesRegex(SystemExit, '2'):
+                with redirect_stderr(stream):
+                    main(['--glif-engine', 'sax', tmp])
+        self.assertTrue("invalid choice" in stream.getvalue())
+
+
+@unittest.skipIf(lxmlET is None, "lxml is not installed")
+class XMLBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xmlBackend = ufonormalizer.XML_BACKEND
+
+    def tearDown(self):
+        ufonormalizer.XML_BACKEND = self.xmlBackend
+
+    def loadsWithBackend(self, data, xmlBackend):
+        ufonormalizer.XML_BACKEND = xmlBackend
+        return _loads(data)
+
+    def test_loads_backends(self):
+        obj = {
+            "string": "a & b",
+            "empty": "",
+            "list": [1, -2, 1.5, True, False, [], {}],
+            "data": b"\x00\x01",
+            "date": datetime.datetime(2020, 1, 2, 3, 4, 5),
+            "dict": {"b": 1, "a": {"c": "d"}}
+        }
+        data = dumps(obj)
+        self.assertEqual(self.loadsWithBackend(data, "lxml"), obj)
+        self.assertEqual(self.loadsWithBackend(data, "stdlib"), obj)
+
+    def test_loads_lxml_fallbacks(self):
+        # binary plists and values the element converter doesn't handle
+        obj = dict(a=1)
+        self.assertEqual(self.loadsWithBackend(dumps(obj, fmt=FMT_BINARY), "lxml"), obj)
+        data = dumps(dict(a=1)).replace(b"<integer>1", b"<integer>0x10")
+        self.assertEqual(self.loadsWithBackend(data, "lxml"), dict(a=16))
+        with self.assertRaises(ExpatError):
+            self.loadsWithBackend(b"<plist><dict>", "lxml")
+
+    def test_loads_backends_empty_elements(self):
+        header = ('<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">'
+                  '<dict>%s</dict></plist>')
+        for body in ("<key></key><string></string>",
+                     "<key/><string/><key>a</key><data/><key> </key><array/>",
+                     "<key>a</key><string>b</string><key>c</key>",
+                     "<key>a</key><key>b</key><string>c</string>",
+                     "<string>a</string>",
+                     "<key>a</key><unknown/><key>b</key><true/>",
+                     "<key>a</key><integer></integer>"):
+            data = (header % body).encode("utf-8")
+            results = []
+            for xmlBackend in ("stdlib", "lxml"):
+                try:
+                    results.append(self.loadsWithBackend(data, xmlBackend))
+                except ValueError as error:
+                    results.append(type(error))
+            self.assertEqual(results[0], results[1], body)
+
+    def test_normalizePlistFile_backends_empty_key(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "lib.plist")
+            results = []
+            for xmlBackend in ("stdlib", "lxml"):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">'
+                            '<dict><key>b</key><string/><key></key><string>a</string></dict></plist>')
+                ufonormalizer.XML_BACKEND = xmlBackend
+                _normalizePlistFile({}, tmp, "lib.plist")
+                with open(path, "rb") as f:
+                    results.append(f.read())
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(loads(results[1]), {"": "a", "b": ""})
+
+    def test_normalizeGLIFString_backends(self):
+        self.maxDiff = None
+        text = GLIFFORMAT2.replace(
+            "<outline>", "<outline><!-- comment --><?pi data?>")
+        ufonormalizer.XML_BACKEND = "stdlib"
+        expected = normalizeGLIFString(text, engine="tree")
+        ufonormalizer.XML_BACKEND = "lxml"
+        self.assertEqual(normalizeGLIFString(text, engine="tree"), expected)
+        with self.assertRaises(ET.ParseError):
+            normalizeGLIFString('<glyph name="a" format="2">', engine="tree")
+
+    def test_normalizeUFO_xmlBackend(self):
+        with TemporaryDirectory() as tmp:
+            stdlibPath = os.path.join(tmp, "stdlib.ufo")
+            lxmlPath = os.path.join(tmp, "lxml.ufo")
+            makeTestUFO(stdlibPath, ["glyph%d" % i for i in range(5)])
+            makeTestUFO(lxmlPath, ["glyph%d" % i for i in range(5)])
+            normalizeUFO(stdlibPath, writeModTimes=False, xmlBackend="stdlib")
+            with self.assertLogs("ufonormalizer", level="DEBUG") as logs:
+                normalizeUFO(lxmlPath, writeModTimes=False, xmlBackend="lxml")
+            self.assertIn("Using the lxml XML backend.", logs.output[0])
+            self.assertEqual(readTree(stdlibPath), readTree(lxmlPath))
+            with self.assertRaisesRegex(UFONormalizerError, "Unknown XML backend"):
+                normalizeUFO(lxmlPath, xmlBackend="sax")
+
+
 class XMLWriterTest(unittest.TestCase):
     def __init__(self, methodName):
         unittest.TestCase.__init__(self, methodName)
@@ -1780,6 +2466,17 @@ class XMLWriterTest(unittest.TestCase):
             writer.attributesToString(attrs),
             'x="1" y="2.1" a="blah"')
 
+    def test_attributesToString_plans(self):
+        writer = XMLWriter(declaration=None)
+        attrs = {"b%s": "<", "a\"": 1, "type": "line", "y": -0.5, "x": 0}
+        expected = 'x="0" y="-0.5" type="line" a&quot;="1" b%s="&lt;"'
+        ufonormalizer._attributeOrderPlans.clear()
+        self.assertEqual(writer.attributesToString(attrs), expected)
+        self.assertEqual(len(ufonormalizer._attributeOrderPlans), 1)
+        self.assertEqual(writer.attributesToString(attrs), expected)
+        self.assertEqual(writer.attributesToString(dict(x=1, y=2)), 'x="1" y="2"')
+        self.assertEqual(len(ufonormalizer._attributeOrderPlans), 2)
+
     def test_xmlEscapeText(self):
         self.assertEqual(xmlEscapeText("&"), "&amp;")
         self.assertEqual(xmlEscapeText("<"), "&lt;")
@@ -1851,6 +2548,23 @@ class XMLWriterTest(unittest.TestCase):
         self.assertEqual(xmlConvertFloat(10.0), '10')
         ufonormalizer.FLOAT_FORMAT = oldFloatFormat
 
+    def test_xmlConvertNumberString(self):
+        oldFloatFormat = ufonormalizer.FLOAT_FORMAT
+        strings = ["0", "-0", "100", "-12.5", "007", "1e3", " 4 ", "1_0", "0.30000000000000004",
+                   "123456789012345", "12345678901234567890", "-1.00000000009", "nan", "inf"]
+        try:
+            for floatFormat in (oldFloatFormat, "%.3f", "%.0f", None):
+                ufonormalizer.FLOAT_FORMAT = floatFormat
+                for string in strings * 2:
+                    self.assertEqual(xmlConvertNumberString(string), xmlConvertFloat(float(string)))
+            hits, misses = numberMemoStatistics()
+            self.assertEqual(xmlConvertNumberString("-12.5"), "-12.5")
+            self.assertEqual(numberMemoStatistics(), (hits + 1, misses))
+            with self.assertRaises(ValueError):
+                xmlConvertNumberString("1,5")
+        finally:
+            ufonormalizer.FLOAT_FORMAT = oldFloatFormat
+
     def test_xmlConvertInt(self):
         self.assertEqual(xmlConvertInt(1), '1')
         self.assertEqual(xmlConvertInt(-1), '-1')
@@ -1939,6 +2653,75 @@ class SubpathTest(unittest.TestCase):
             text = f.read()
         self.assertEqual(text, expected_text)
 
+    def test_subpathWriteBytes(self):
+        self.assertTrue(subpathWriteBytes(b"foo", self.directory, self.filename))
+        os.utime(self.filepath, ns=(0, 0))
+        self.assertFalse(subpathWriteBytes(b"foo", self.directory, self.filename))
+        self.assertEqual(os.stat(self.filepath).st_mtime_ns, 0)
+        self.assertTrue(subpathWriteBytes(b"bar", self.directory, self.filename))
+        self.assertTrue(subpathWriteBytes(b"foobar", self.directory, self.filename))
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b"foobar")
+
+    def test_subpathWriteBytes_atomic(self):
+        subpathWriteBytes(b"foo", self.directory, self.filename)
+        os.chmod(self.filepath, 0o640)
+        inode = os.stat(self.filepath).st_ino
+        self.assertTrue(subpathWriteBytes(b"bar", self.directory, self.filename))
+        self.assertEqual(os.stat(self.filepath).st_mode & 0o777, 0o640)
+        if os.name != "nt":
+            self.assertNotEqual(os.stat(self.filepath).st_ino, inode)
+        # a failed write leaves the file untouched
+        with self.assertRaises(TypeError):
+            subpathWriteBytes("foobar", self.directory, self.filename)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b"bar")
+        self.assertEqual(sorted(os.listdir(self.directory)), [self.filename])
+
+    @unittest.skipIf(not ufonormalizer._linuxFastPath, "posix_fadvise is not available")
+    def test_subpathReadBytes_advised(self):
+        with open(self.filepath, 'wb') as f:
+            f.write(b"foo\r\nbar\rbaz\n")
+        subpathAdviseWillNeed(self.directory, self.filename)
+        self.assertIn(self.filepath, ufonormalizer._advisedDescriptors)
+        self.assertEqual(subpathReadBytes(self.directory, self.filename), b"foo\r\nbar\rbaz\n")
+        self.assertNotIn(self.filepath, ufonormalizer._advisedDescriptors)
+        subpathAdviseWillNeed(self.directory, self.filename)
+        subpathWriteBytes(b"bar", self.directory, self.filename)
+        self.assertEqual(subpathReadFile(self.directory, self.filename), "bar")
+        self.assertNotIn(self.filepath, ufonormalizer._advisedDescriptors)
+
+    def test_readAheadOrder(self):
+        fileNames = ["file%d" % i for i in range(150)]
+        for fileName in fileNames:
+            subpathWriteBytes(b"foo", self.directory, fileName)
+        ordered = list(_readAheadOrder(self.directory, "", fileNames[10:]))
+        self.assertEqual(sorted(ordered), sorted(fileNames[10:]))
+        self.assertEqual(ufonormalizer._advisedDescriptors, {})
+        if ufonormalizer._linuxFastPath:
+            listing = [name for name in os.listdir(self.directory) if name in ordered]
+            self.assertEqual(ordered, listing)
+
+    def test_subpathWriteBytes_stored_digest(self):
+        with _fileSystemSnapshot():
+            self.assertTrue(subpathWriteBytes(b"foo", self.directory, self.filename))
+            token = subpathGetHash(self.directory, self.filename)
+            self.assertFalse(subpathWriteBytes(b"foo", self.directory, self.filename))
+            self.assertTrue(subpathWriteBytes(b"bar", self.directory, self.filename))
+            storedToken = subpathGetHash(self.directory, self.filename)
+            self.assertNotEqual(storedToken, token)
+        # the stored digest matches the one read from the file
+        self.assertEqual(subpathGetHash(self.directory, self.filename), storedToken)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b"bar")
+
+    def test_subpathWritePlist_unchanged(self):
+        data = dict(a="foo")
+        subpathWritePlist(data, self.directory, self.plistname)
+        os.utime(self.plistpath, ns=(0, 0))
+        subpathWritePlist(dict(data), self.directory, self.plistname)
+        self.assertEqual(os.stat(self.plistpath).st_mtime_ns, 0)
+
     def test_subpathWritePlist(self):
         expected_data = dict([('a', 'foo'), ('b', 'bar'), ('c', '™')])
         subpathWritePlist(expected_data, self.directory, self.plistname)
@@ -1971,6 +2754,20 @@ class SubpathTest(unittest.TestCase):
         _normalizePlistFile({}, self.directory, "empty.plist")
         self.assertFalse(os.path.exists(emptyPlist))
 
+    def test__writeNormalizedPlist(self):
+        data = dict(color="1,0,0,.50", lib={"b": [1, 2.5], "a": b"\x00", "c": (True,)})
+        subpathWritePlist(dict(data), self.directory, "twoPass.plist")
+        _normalizePlistFile({}, self.directory, "twoPass.plist",
+                            preprocessor=_normalizeLayerInfoColor)
+        _writeNormalizedPlist(dict(data), self.directory, ("onePass.plist",),
+                              preprocessor=_normalizeLayerInfoColor)
+        with open(os.path.join(self.directory, "twoPass.plist"), "rb") as f:
+            expected = f.read()
+        with open(os.path.join(self.directory, "onePass.plist"), "rb") as f:
+            self.assertEqual(f.read(), expected)
+        _writeNormalizedPlist({}, self.directory, ("onePass.plist",))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "onePass.plist")))
+
     def test__normalizePlistFile_keep_empty(self):
         emptyPlist = os.path.join(self.directory, "empty.plist")
         with open(emptyPlist, "w") as f:
@@ -1997,6 +2794,31 @@ class SubpathTest(unittest.TestCase):
         self.assertTrue(subpathNeedsRefresh(modTimes, self.directory,
                         self.filename))
 
+    def test_subpathGetStatSignature(self):
+        self.createTestFile('foo')
+        stat = os.stat(self.filepath)
+        self.assertEqual(
+            subpathGetStatSignature(self.directory, self.filename),
+            "%d:%d" % (stat.st_mtime_ns, stat.st_size))
+        signatures = subpathScanStatSignatures(self.directory)
+        self.assertEqual(signatures,
+                         {self.filename: subpathGetStatSignature(self.directory, self.filename)})
+
+    def test_subpathNeedsRefresh_stat_signature(self):
+        self.createTestFile('foo')
+        modTimes = {self.filename: subpathGetStatSignature(self.directory, self.filename)}
+        self.assertFalse(subpathNeedsRefresh(modTimes, self.directory, self.filename))
+        signatures = subpathScanStatSignatures(self.directory)
+        self.assertFalse(subpathNeedsRefresh(modTimes, self.directory, self.filename,
+                                             signatures=signatures))
+        # no sleep: a change within the same timestamp tick is still detected by size
+        with open(self.filepath, 'w', encoding='utf-8') as f:
+            f.write('foobar')
+        self.assertTrue(subpathNeedsRefresh(modTimes, self.directory, self.filename))
+        signatures = subpathScanStatSignatures(self.directory)
+        self.assertTrue(subpathNeedsRefresh(modTimes, self.directory, self.filename,
+                                            signatures=signatures))
+
     def test_storeModTimes(self):
         num = 5
         lib = {}
@@ -2013,6 +2835,15 @@ class SubpathTest(unittest.TestCase):
         storeModTimes(lib, modTimes)
         self.assertEqual('\n'.join(lines), lib[modTimeLibKey])
 
+    def test_storeModTimes_hash_tokens(self):
+        lib = {}
+        modTimes = {"a.glif": "blake2b:00ff", "b.glif": 1.25}
+        storeModTimes(lib, modTimes)
+        self.assertEqual(
+            lib[modTimeLibKey],
+            "version: %s\nblake2b:00ff a.glif\n1.2 b.glif" % ufonormalizerVersion)
+        self.assertEqual(readModTimes(lib), {"a.glif": "blake2b:00ff", "b.glif": 1.2})
+
     def test_readModTimes(self):
         num = 5
         lib = {}
@@ -2026,6 +2857,191 @@ class SubpathTest(unittest.TestCase):
         lib[modTimeLibKey] = '\n'.join(lines)
         self.assertEqual(readModTimes(lib), modTimes)
 
+    def test_readModTimes_unknown_format(self):
+        for text in ("version: 0.4.3.dev0\n12.0 a.glif",
+                     "version: %s\nrules: glif1\nglif1 1:2 a.glif" % ufonormalizerVersion,
+                     "version: %s\nrules: glif1=1.10\n1:2" % ufonormalizerVersion,
+                     "version: %s\n12.0" % ufonormalizerVersion):
+            self.assertEqual(readModTimes({modTimeLibKey: text}), {}, text)
+        self.assertEqual(readModTimes({modTimeLibKey: ["version"]}), {})
+
+    def test_readModTimes_rule_versions(self):
+        lib = {}
+        modTimes = {
+            "a.glif": ("glif1", "1:2:3"),
+            "b.glif": ("glif2", "4:5:6"),
+            "fontinfo.plist": ("fontinfo", "blake2b:00ff"),
+        }
+        storeModTimes(lib, modTimes)
+        lines = lib[modTimeLibKey].splitlines()
+        self.assertTrue(lines[1].startswith("rules: contents=1.10 fontinfo=1.10 glif1=1.10 glif2=1.10 "))
+        self.assertEqual(lines[2:], [
+            "glif1 1:2:3 a.glif",
+            "glif2 4:5:6 b.glif",
+            "fontinfo blake2b:00ff fontinfo.plist",
+        ])
+        self.assertEqual(readModTimes(lib), modTimes)
+        # another normalizer version keeps the records
+        lib[modTimeLibKey] = lib[modTimeLibKey].replace(
+            "version: %s" % ufonormalizerVersion, "version: 0.0.0")
+        self.assertEqual(readModTimes(lib), modTimes)
+        # a new rule version only discards the records of that kind
+        versions = ufonormalizer.normalizationRuleVersions
+        ufonormalizer.normalizationRuleVersions = dict(versions, glif1=2)
+        try:
+            self.assertEqual(sorted(readModTimes(lib)), ["b.glif", "fontinfo.plist"])
+        finally:
+            ufonormalizer.normalizationRuleVersions = versions
+        # a new float precision discards everything
+        floatFormat = ufonormalizer.FLOAT_FORMAT
+        ufonormalizer.FLOAT_FORMAT = "%.3f"
+        try:
+            self.assertEqual(readModTimes(lib), {})
+        finally:
+            ufonormalizer.FLOAT_FORMAT = floatFormat
+
+
+class FileSystemSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, "sub"))
+        for subpath in ("a", "b", os.path.join("sub", "c")):
+            with open(os.path.join(self.directory, subpath), "w", encoding="utf-8") as f:
+                f.write("foo")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_queries(self):
+        expected = subpathScanStatSignatures(self.directory)
+        with _fileSystemSnapshot():
+            self.assertTrue(subpathExists(self.directory, "a"))
+            self.assertTrue(subpathExists(self.directory, "sub", "c"))
+            self.assertFalse(subpathExists(self.directory, "z"))
+            self.assertFalse(subpathExists(self.directory, "y", "z"))
+            self.assertEqual(subpathListDirectory(self.directory),
+                             dict(a=False, b=False, sub=True))
+            self.assertEqual(subpathScanStatSignatures(self.directory), expected)
+            self.assertEqual(subpathGetStatSignature(self.directory, "a"), expected["a"])
+            self.assertEqual(subpathGetModTime(self.directory, "a"),
+                             os.path.getmtime(os.path.join(self.directory, "a")))
+            with self.assertRaises(FileNotFoundError):
+                subpathGetModTime(self.directory, "z")
+
+    def test_unlisted_names(self):
+        # a name that differs in case from the listed one on a case
+        # insensitive file system is missing from the listing too
+        with _fileSystemSnapshot():
+            subpathListDirectory(self.directory)
+            path = os.path.join(self.directory, "e")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("foo")
+            self.assertTrue(subpathExists(self.directory, "e"))
+            self.assertEqual(subpathGetModTime(self.directory, "e"), os.path.getmtime(path))
+            self.assertEqual(subpathReadFile(self.directory, "e"), "foo")
+            self.assertFalse(subpathExists(self.directory, "z"))
+
+    def test_changes(self):
+        with _fileSystemSnapshot():
+            subpathScanStatSignatures(self.directory)
+            subpathScanStatSignatures(self.directory, "sub")
+            subpathWriteFile("foobar", self.directory, "a")
+            self.assertEqual(subpathGetStatSignature(self.directory, "a"),
+                             subpathScanStatSignatures(self.directory)["a"])
+            self.assertEqual(subpathScanStatSignatures(self.directory)["a"].split(":")[1], "6")
+            subpathWriteFile("new", self.directory, "n")
+            self.assertTrue(subpathExists(self.directory, "n"))
+            subpathRemoveFile(self.directory, "b")
+            self.assertFalse(subpathExists(self.directory, "b"))
+            subpathRenameFile(self.directory, "a", "d")
+            self.assertFalse(subpathExists(self.directory, "a"))
+            self.assertTrue(subpathExists(self.directory, "d"))
+            subpathRenameDirectory(self.directory, "sub", "other")
+            self.assertFalse(subpathExists(self.directory, "sub", "c"))
+            self.assertTrue(subpathExists(self.directory, "other", "c"))
+            self.assertEqual(subpathListDirectory(self.directory),
+                             dict(d=False, n=False, other=True))
+            self.assertEqual(subpathListDirectory(self.directory, "sub"), {})
+
+    def test_plistCache(self):
+        subpathWritePlist(dict(a=[1, 2]), self.directory, "test.plist")
+        parsed = []
+        loads = ufonormalizer._loads
+
+        def countingLoads(data):
+            parsed.append(data)
+            return loads(data)
+
+        ufonormalizer._loads = countingLoads
+        try:
+            with _fileSystemSnapshot():
+                data = subpathReadPlist(self.directory, "test.plist")
+                data["a"].append(3)
+                self.assertEqual(subpathReadPlist(self.directory, "test.plist"), dict(a=[1, 2]))
+                self.assertEqual(len(parsed), 1)
+                subpathWritePlist(data, self.directory, "test.plist")
+                self.assertEqual(subpathReadPlist(self.directory, "test.plist"), dict(a=[1, 2, 3]))
+                self.assertEqual(len(parsed), 2)
+        finally:
+            ufonormalizer._loads = loads
+
+
+class RenamePlanTest(unittest.TestCase):
+
+    def test_renamePlan(self):
+        temp = "org.unifiedfontobject.normalizer.0"
+        self.assertEqual(renamePlan([("a", "a"), ("b", "c")]), [("b", "c")])
+        self.assertEqual(renamePlan([("a", "b"), ("b", "c")]), [("b", "c"), ("a", "b")])
+        self.assertEqual(renamePlan([("a", "b"), ("b", "a"), ("c", "d")]),
+                         [("c", "d"), ("a", temp), ("b", "a"), (temp, "b")])
+        self.assertEqual(renamePlan([("a", "A")]), [("a", temp), (temp, "A")])
+        self.assertEqual(renamePlan([("a", "B_"), ("b", "A_")]),
+                         [("a", "B_"), ("b", "A_")])
+        self.assertEqual(renamePlan([("a", "B"), ("b", "A")]),
+                         [("a", temp), ("b", "A"), (temp, "B")])
+
+    def test_foldGlyphNames(self):
+        previous = {"a": "a.glif", "b": "b.glif"}
+        self.assertEqual(_foldGlyphNames({"a": "a.glif", "B": "B.glif"}, previous),
+                         {"a": "a.glif", "B": "B_.glif"})
+        # clashes need all glyph names
+        self.assertIsNone(_foldGlyphNames({"b_": "b_.glif", "B": "x.glif"}, {"b_": "b_.glif"}))
+        self.assertIsNone(_foldGlyphNames({"a": "a.glif", "B": "x.glif", "b_": "y.glif"}, previous))
+        previous["c"] = "a000000000000001.glif"
+        self.assertIsNone(_foldGlyphNames({"a": "a.glif", "c": "a000000000000001.glif"}, previous))
+
+    def test_normalizeGlyphNames_renames(self):
+        with TemporaryDirectory() as directory:
+            subpathWriteFile(METAINFO_PLIST % 2, directory, "metainfo.plist")
+            os.mkdir(os.path.join(directory, "glyphs"))
+            oldGlyphMapping = {"A": "a.glif", "a": "A_.glif", "B": "B_.glif", "c": "d.glif"}
+            for glyphName, fileName in oldGlyphMapping.items():
+                subpathWriteFile(glyphName, directory, "glyphs", fileName)
+            subpathWritePlist(oldGlyphMapping, directory, "glyphs", "contents.plist")
+            renamed = []
+            rename = ufonormalizer.subpathRenameFile
+
+            def recordingRename(ufoPath, fromSubpath, toSubpath):
+                renamed.append((fromSubpath[-1], toSubpath[-1]))
+                rename(ufoPath, fromSubpath, toSubpath)
+
+            ufonormalizer.subpathRenameFile = recordingRename
+            try:
+                temp = "org.unifiedfontobject.normalizer.0"
+                expected = [("d.glif", "c.glif"), ("a.glif", temp), ("A_.glif", "a.glif"),
+                            (temp, "A_.glif")]
+                self.assertEqual(renamePlanReport(directory),
+                                 [(subpathJoin("glyphs", fromName), subpathJoin("glyphs", toName))
+                                  for fromName, toName in expected])
+                self.assertEqual(renamed, [])
+                normalizeGlyphNames(directory, "glyphs")
+                self.assertEqual(renamed, expected)
+            finally:
+                ufonormalizer.subpathRenameFile = rename
+            for glyphName, fileName in normalizeGlyphNames(directory, "glyphs").items():
+                self.assertEqual(subpathReadFile(directory, "glyphs", fileName), glyphName)
+
 
 class NameTranslationTest(unittest.TestCase):
 
@@ -2098,6 +3114,46 @@ class NameTranslationTest(unittest.TestCase):
             r'00000.ABCDEFGHIJKLM.*NOPQRSTUVW000000000000001.0000000000'
         )
 
+    def test_userNameToFileName_FileNameIndex(self):
+        userNames = []
+        for base in ("a", "a.alt", "A" * 300, "con"):
+            for index in range(40):
+                userNames.append(base)
+                userNames.append(base + "000000000000001")
+        userNames.append("1")
+        plain = set()
+        indexed = FileNameIndex()
+        for userName in userNames:
+            fileName = userNameToFileName(userName, plain, suffix=".glif")
+            self.assertEqual(userNameToFileName(userName, indexed, suffix=".glif"), fileName)
+            plain.add(fileName.lower())
+            indexed.add(fileName.lower())
+        self.assertEqual(indexed, plain)
+        self.assertEqual(len(indexed), len(userNames))
+        prefix = "0" * 5
+        existing = FileNameIndex(prefix + str(i) for i in range(1, 50))
+        for i in range(50, 60):
+            fileName = handleClash2(existing, prefix)
+            self.assertEqual(fileName, prefix + str(i))
+            existing.add(fileName)
+
+    def test_userNamesToFileNames(self):
+        userNames = ["a", "A", "a", ".notdef", "con", "CON.alt", "aux.con.b", "\u0130\u00c9e",
+                     "a*b", "\x7f\x01", "A" * 300, "A" * 300, "com1", "lpt1.Lpt2"]
+        existing = ["b.glif", "a_.glif"]
+        expected = []
+        plain = set(existing)
+        for userName in userNames:
+            fileName = userNameToFileName(userName, plain, suffix=".glif")
+            plain.add(fileName.lower())
+            expected.append(fileName)
+        self.assertEqual(userNamesToFileNames(userNames, existing, suffix=".glif"), expected)
+        self.assertEqual(existing, ["b.glif", "a_.glif"])
+        index = FileNameIndex(existing)
+        self.assertEqual(userNamesToFileNames(userNames, index, suffix=".glif"), expected)
+        self.assertEqual(index, plain)
+        self.assertEqual(userNamesToFileNames(["A", "a"], prefix="glyphs."), ["glyphs.A_", "glyphs.a"])
+
     def test_handleClash2(self):
         prefix = ("0" * 5) + "."
         suffix = "." + ("0" * 10)